@@ -1,8 +1,22 @@
 import os
 import json
-import math
-from flask import Flask, request, redirect, url_for, session, render_template, abort
+import hashlib
+import time
+from flask import (
+    Flask, Response, request, redirect, url_for, session, render_template, abort,
+    jsonify, stream_with_context, g, before_render_template, template_rendered, request_finished
+)
 import logging
+import events
+import metrics
+from batch import iter_scored
+from assets import AssetManifest, choose_encoding, compress_variants
+from bank import BankRegistry
+from instruments import InstrumentRegistry
+from diagrams import RenderCache, RenderError, graph_etag, render_svg
+from results import ResultStore
+from sessions import configure_sessions
+from engine import record_answer, skipped_answer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,119 +29,227 @@ if not secret_key:
     raise RuntimeError("FLASK_SECRET_KEY environment variable not set")
 app.secret_key = secret_key
 
-SEVERITY_ADJUSTMENT = {
-    "severe": 1.0,
-    "moderate": 0.75,
-    "mild": 0.5
-}
-
-def calculate_question_weight(dsm_codes, severity, binary=False):
-    severity_norm = severity.lower()
-    if severity_norm in ['no', 'none', '']:
-        return 0.0
-    if binary:
-        return 1.0 if severity_norm == 'yes' else 0.0
-    base_weight = 0.9
-    reduction = 0.2 * (len(dsm_codes) - 1)
-    weight = max(0.5, base_weight - reduction)
-    adjusted = weight * SEVERITY_ADJUSTMENT.get(severity_norm, 0.0)
-    return round(adjusted, 2)
-
 try:
-    with open("questions.json", "r") as f:
-        questions = json.load(f)
+    bank_registry = BankRegistry(check_interval=float(os.environ.get('BANK_CHECK_INTERVAL', 2.0)))
 except Exception as e:
-    logging.error(f"Error loading questions.json: {e}")
+    logging.error(f"Error loading question bank: {e}")
     raise
 
-# Initialize question weights (using "Severe" as the default severity)
-for q in questions:
-    default_severity = "Yes" if q.get("binary", False) else "Severe"
-    q["question_weight"] = calculate_question_weight(
-        q["dsm_codes"], 
-        default_severity,
-        q.get("binary", False)
-    )
+# Further instruments from INSTRUMENTS_DIR, served under /i/<instrument>/.
+instrument_registry = InstrumentRegistry(bank_registry, check_interval=bank_registry.check_interval)
 
-validation_rules = [
-    {
-        "symptoms": ["manic_episode", "depressed_mood"],
-        "condition": "not_simultaneous",
-        "message": "Manic episode and depression are typically not simultaneous."
-    }
-]
+configure_sessions(app, instrument_registry)
+
+asset_manifest = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
+
+diagram_cache = RenderCache(int(os.environ.get('DIAGRAM_CACHE_SIZE', 32)))
+
+results_path = os.environ.get('RESULTS_PATH', 'results.sqlite3')
+result_store = ResultStore(results_path, instrument_registry.default_name) if results_path else None
+
+def registry_for(instrument):
+    """The BankRegistry of ``instrument``; None is the root bank."""
+    if instrument is None:
+        return bank_registry
+    return instrument_registry.registry(instrument)
+
+def bank_for(sess, instrument=None):
+    """The bank version a session is pinned to, or the current one for new sessions."""
+    registry = registry_for(instrument)
+    return registry.get(sess.get('bank_version')) or registry.current()
+
+@app.url_value_preprocessor
+def pull_instrument(endpoint, values):
+    instrument = values.pop('instrument', None) if values else None
+    # The root bank is also reachable by name; its pages link back to the root URLs.
+    g.instrument = None if instrument == instrument_registry.default_name else instrument
+
+@app.url_defaults
+def add_instrument(endpoint, values):
+    if g.get('instrument') is not None and 'instrument' not in values:
+        if app.url_map.is_endpoint_expecting(endpoint, 'instrument'):
+            values['instrument'] = g.instrument
+
+# 'adaptive' drops questions that can no longer change the reported diagnoses.
+ASSESSMENT_MODE = os.environ.get('ASSESSMENT_MODE', 'full')
 
 def get_total_questions():
-    return len(questions)
+    return len(bank_registry.current().questions)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = metrics.start_profile()
+
+@app.before_request
+def check_instrument():
+    # Runs on every request, default instrument included, so idle ones are dropped
+    # even when nothing else asks for a named instrument.
+    instrument_registry.sweep()
+    if g.get('instrument') is not None and registry_for(g.instrument) is None:
+        return Response(f"Unknown instrument '{g.instrument}'.", status=404, mimetype='text/plain')
+
+@request_finished.connect_via(app)
+def record_request(sender, response, **extra):
+    started = g.get('request_started')
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_profile(g.get('profile'), route, seconds)
+    metrics.record_response(request.method, route, response, seconds, app.config['SESSION_COOKIE_NAME'])
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.template_seconds.observe(time.perf_counter() - started, template.name)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def compressed_response(variants, mimetype):
+    encoding = choose_encoding(variants, request.accept_encodings)
+    response = Response(variants[encoding], mimetype=mimetype)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    item = asset_manifest.get(digest, filename)
+    if item is None:
+        if filename in asset_manifest.assets:
+            # An old fingerprint from a page cached before a deploy.
+            return redirect(asset_manifest.url(filename))
+        return Response("Not found.", status=404, mimetype='text/plain')
+    response = compressed_response(item.variants, item.mimetype)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+# Pages without per-request content, rendered once per process.
+static_pages = {}
+
+def static_page(template):
+    page = static_pages.get(template)
+    if page is None:
+        html = render_template(template).encode()
+        page = static_pages[template] = (compress_variants(html, 'text/html'), hashlib.sha256(html).hexdigest()[:16])
+    variants, etag = page
+    response = compressed_response(variants, 'text/html')
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# The assessment page chrome around the question form, split once on a marker.
+_FRAGMENT_MARKER = '<!--question-fragment-->'
+page_shells = {}
+
+def render_question(**context):
+    shell = page_shells.get('assessment_layout.html')
+    if shell is None:
+        html = render_template('assessment_layout.html', main_content=_FRAGMENT_MARKER)
+        shell = page_shells['assessment_layout.html'] = tuple(html.split(_FRAGMENT_MARKER))
+    head, tail = shell
+    return head + render_template('_question.html', **context) + tail
 
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return static_page('index.html')
 
 @app.route('/start')
+@app.route('/i/<instrument>/start')
 def start():
+    if g.instrument is None:
+        session.pop('instrument', None)
+    else:
+        session['instrument'] = g.instrument
+    session['bank_version'] = registry_for(g.instrument).current().version
     session['index'] = 0
     session['answers'] = {}
-    logging.info("Starting new assessment.")
+    session['answered_mask'] = 0
+    session['yes_mask'] = 0
+    session.pop('result_recorded', None)
+    session.pop('tally', None)
+    if request.args.get('mode', ASSESSMENT_MODE) == 'adaptive':
+        session['adaptive'] = True
+        session['asked'] = []
+        session['current'] = None
+        session['remaining'] = 0
+    else:
+        session.pop('adaptive', None)
+    events.emit('start', bank_version=session['bank_version'])
     return redirect(url_for('ask_question'))
 
 @app.route('/ask', methods=['GET', 'POST'])
+@app.route('/i/<instrument>/ask', methods=['GET', 'POST'])
 def ask_question():
+    if session.get('instrument') != g.instrument:
+        # The session belongs to another instrument's assessment.
+        return redirect(url_for('start'))
+    bank = bank_for(session, g.instrument)
+    if session.get('adaptive'):
+        return ask_adaptive(bank)
+    questions = bank.questions
     idx = session.get('index', 0)
     answers = session.get('answers', {})
+    answered, yes = answer_masks(bank, answers)
+    tally = session_tally(session, bank, answers)
     direction = request.args.get('direction')
 
     if direction == 'back' and idx > 0:
         idx = session.get('last_answered', 0)
         session['index'] = idx
-        answered = [
-            i for i, q in enumerate(questions[:idx])
-            if q['symptom'] in answers and not answers[q['symptom']].get('was_skipped', False)
-        ]
-        session['last_answered'] = answered[-1] if answered else 0
+        session['last_answered'] = max(bank.graph.previous_answered(idx, answered), 0)
         return redirect(url_for('ask_question'))
 
     if request.method == 'POST':
         severity = request.form.get('severity', 'No')
-        severity_norm = severity.lower()
-        answer = 'no' if severity_norm in ['no', 'none', ''] else 'yes'
         prev_idx = idx - 1
 
         if 0 <= prev_idx < len(questions):
             symptom = questions[prev_idx]['symptom']
-            codes = questions[prev_idx].get('dsm_codes', [])
-            q_weight = calculate_question_weight(codes, severity)
-            if not validate_answer(symptom, answer, answers):
-                msg = next(
-                    rule['message'] 
-                    for rule in validation_rules 
-                    if symptom in rule['symptoms']
-                )
-                return render_template('assessment.html', error=msg)
-            answers[symptom] = {
-                'value': answer, 
-                'severity': severity, 
-                'question_weight': q_weight,
-                'dsm_codes': codes,
-                'was_skipped': False
-            }
+            entry = record_answer(questions[prev_idx], severity)
+            if not bank.validate_answer(symptom, entry['value'], answers):
+                return render_template('assessment.html', error=bank.validation_message(symptom))
+            old = answers.get(symptom)
+            answers[symptom] = entry
+            bank.rules.update_tally(tally, answers, symptom, old)
+            session['tally'] = tally
+            answered, yes = bank.graph.record(prev_idx, entry['value'], answered, yes)
             session['answers'] = answers
             session['last_answered'] = prev_idx
-            logging.info(f"Recorded answer for '{symptom}': {answers[symptom]}")
+            session.pop('result_recorded', None)
+            events.emit('answer', symptom=symptom, answer=entry)
 
     total_questions = len(questions)
-    while idx < total_questions:
-        if should_skip_question(questions[idx], answers):
-            idx += 1
-            session['index'] = idx
-            continue
-        break
+    idx, skipped, answered, yes = bank.graph.next_question(idx, answered, yes)
+    metrics.skip_iterations.observe(len(skipped))
+    if skipped:
+        for i in skipped:
+            symptom = questions[i]['symptom']
+            old = answers.get(symptom)
+            skip_question(questions[i], answers)
+            bank.rules.update_tally(tally, answers, symptom, old)
+        session['answers'] = answers
+        session['tally'] = tally
+    session['answered_mask'] = answered
+    session['yes_mask'] = yes
+    session['index'] = idx
 
     if idx < total_questions:
         current_q = questions[idx]
         session['index'] = idx + 1
-        return render_template(
-            'assessment.html',
+        return render_question(
             question=current_q["question"],
             question_weight=current_q.get("question_weight", 1.0),
             current_question=idx,
@@ -135,132 +257,84 @@ def ask_question():
             binary=current_q.get("binary", False)
         )
     else:
-        return generate_diagnosis()
-
-def needs_to_skip(q, answers):
-    if "dependency" in q:
-        return answers.get(q["dependency"], {}).get('value', "no") != "yes"
-    if "dependencies" in q:
-        return not any(answers.get(dep, {}).get('value', "no") == "yes" for dep in q["dependencies"])
-    return False
-
-def should_skip_question(q, answers):
-    if needs_to_skip(q, answers):
-        logging.info(f"Skipping question '{q['symptom']}' due to unmet dependencies.")
-        answers[q['symptom']] = {
-            'value': 'no', 
-            'severity': "No", 
-            'question_weight': 0.0, 
-            'dsm_codes': q.get('dsm_codes', []),
-            'was_skipped': True
-        }
-        session['answers'] = answers
-        return True
-    return False
-
-def validate_answer(symptom: str, answer: str, answers: dict) -> bool:
-    if answer.lower() == 'no':
-        return True
-    for rule in validation_rules:
-        if symptom in rule['symptoms'] and rule['condition'] == 'not_simultaneous':
-            if any(answers.get(other, {}).get('value', 'no') == 'yes' 
-                   for other in rule['symptoms'] if other != symptom):
-                return False
-    return True
-
-def generate_diagnosis():
+        return generate_diagnosis(bank)
+
+def ask_adaptive(bank):
+    """Adaptive flow: ``asked`` is the answer history, ``current`` the question on screen."""
+    questions = bank.questions
     answers = session.get('answers', {})
-    diagnoses = []
-    severity_order = {"No": 0, "Mild": 1, "Moderate": 2, "Severe": 3}
-
-    diagnosis_rules = [
-        {
-            "name": "Major Depressive Disorder",
-            "dsm_code": "296.2x",
-            "symptoms": ["depressed_mood", "loss_of_interest", "fatigue", "sleep_disturbance", "feelings_of_guilt", "difficulty_concentrating", "social_withdrawal", "weight_appetite_change", "hopelessness"]
-        },
-        {
-            "name": "Generalized Anxiety Disorder",
-            "dsm_code": "300.02",
-            "symptoms": ["excessive_worry", "restlessness", "difficulty_concentrating", "irritability", "sleep_disturbance", "fatigue", "muscle_tension"]
-        },
-        {
-            "name": "Bipolar Disorder",
-            "dsm_code": "296.4x",
-            "symptoms": ["depressed_mood", "loss_of_interest", "manic_episode", "decreased_need_for_sleep", "racing_thoughts", "impulsivity", "irritability"]
-        },
-        {
-            "name": "Schizophrenia",
-            "dsm_code": "295.90",
-            "symptoms": [
-                {"any_of": ["hallucinations", "delusions"]},
-                "disorganized_speech",
-                "social_withdrawal",
-                "disorganized_behavior"
-            ]
-        },
-        {
-            "name": "Obsessive-Compulsive Disorder",
-            "dsm_code": "300.3",
-            "symptoms": ["obsessions", "compulsions", "distress", "time_consuming", "suppress_obsessions"]
-        },
-        {
-            "name": "Post-Traumatic Stress Disorder",
-            "dsm_code": "309.81",
-            "symptoms": [
-                "trauma_exposure",
-                {"any_of": ["intrusive_memories", "flashbacks"]},
-                "avoidance",
-                "hyperarousal"
-            ]
-        },
-        {
-            "name": "Attention-Deficit/Hyperactivity Disorder",
-            "dsm_code": "314.0x",
-            "symptoms": ["inattention", "hyperactivity", "impulsivity", "difficulty_organizing", "difficulty_concentrating", "irritability"]
-        }
-    ]
-
-    for rule in diagnosis_rules:
-        total_symptoms = 0
-        present_count = 0
-        total_weight = 0.0
-        
-        for sym in rule["symptoms"]:
-            total_symptoms += 1
-            if isinstance(sym, dict) and "any_of" in sym:
-                answered = False
-                weight = 0.0
-                for candidate in sym["any_of"]:
-                    ans = answers.get(candidate, {})
-                    if ans.get('value', 'no') == 'yes' and ans.get('question_weight', 0) > 0:
-                        answered = True
-                        weight = ans.get('question_weight', 0)
-                        break
-                if answered:
-                    present_count += 1
-                    total_weight += weight
-            else:
-                ans = answers.get(sym, {})
-                if ans.get('value', 'no') == 'yes' and ans.get('question_weight', 0) > 0:
-                    present_count += 1
-                    total_weight += ans.get('question_weight', 0)
-
-        threshold = math.ceil(total_symptoms * 0.7)
-        if present_count >= threshold and present_count > 0:
-            result_weight = total_weight / present_count
-            diagnoses.append({
-                "name": rule["name"],
-                "dsm_code": rule["dsm_code"],
-                "question_weight": result_weight
-            })
-
-    valid_diagnoses = sorted(
-        [d for d in diagnoses if d['question_weight'] * 100 >= 40],
-        key=lambda x: x['question_weight'],
-        reverse=True
+    asked = session.get('asked', [])
+    tally = session_tally(session, bank, answers)
+
+    if request.args.get('direction') == 'back':
+        if asked:
+            last = asked.pop()
+            symptom = questions[last]['symptom']
+            old = answers.pop(symptom, None)
+            session['tally'] = bank.rules.update_tally(tally, answers, symptom, old)
+            session['answers'] = answers
+            session['asked'] = asked
+            session['current'] = last
+            session.pop('result_recorded', None)
+        return redirect(url_for('ask_question'))
+
+    current = session.get('current')
+    if request.method == 'POST' and current is not None:
+        symptom = questions[current]['symptom']
+        entry = record_answer(questions[current], request.form.get('severity', 'No'))
+        if not bank.validate_answer(symptom, entry['value'], answers):
+            return render_template('assessment.html', error=bank.validation_message(symptom))
+        old = answers.get(symptom)
+        answers[symptom] = entry
+        session['tally'] = bank.rules.update_tally(tally, answers, symptom, old)
+        asked.append(current)
+        session['answers'] = answers
+        session['asked'] = asked
+        session.pop('result_recorded', None)
+        events.emit('answer', symptom=symptom, answer=entry)
+        current = None
+
+    if current is None:
+        current, session['remaining'] = bank.planner.next_question(answers)
+    session['current'] = current
+    if current is None:
+        return generate_diagnosis(bank)
+
+    q = questions[current]
+    return render_question(
+        question=q["question"],
+        question_weight=q.get("question_weight", 1.0),
+        current_question=len(asked),
+        # Questions still relevant, counting this one; it only shrinks as rules are decided.
+        total_questions=len(asked) + max(session.get('remaining', 1), 1),
+        binary=q.get("binary", False)
     )
 
+def session_tally(sess, bank, answers):
+    """The session's per-rule tallies, rebuilt once if it has none for this bank."""
+    tally = sess.get('tally')
+    if tally is None or len(tally['counts']) != len(bank.rules.slots):
+        tally = bank.rules.tally(answers)
+    return tally
+
+def answer_masks(bank, answers):
+    # Sessions started before the masks were kept in the session rebuild them once.
+    if 'answered_mask' in session and 'yes_mask' in session:
+        return session['answered_mask'], session['yes_mask']
+    return bank.graph.masks(answers)
+
+def skip_question(q, answers):
+    events.emit('skip', symptom=q['symptom'])
+    answers[q['symptom']] = skipped_answer(q)
+
+def generate_diagnosis(bank):
+    with metrics.diagnosis_seconds.time():
+        return render_diagnosis(bank)
+
+def render_diagnosis(bank):
+    answers = session.get('answers', {})
+    valid_diagnoses = bank.rules.diagnose_tally(session_tally(session, bank, answers), answers)
+
     if valid_diagnoses:
         diagnosis_items = []
         for d in valid_diagnoses:
@@ -274,13 +348,181 @@ def generate_diagnosis():
     else:
         diagnosis_result = '<div class="diagnosis-item">No diagnosis could be determined based on your responses.</div>'
 
-    logging.info(f"Final diagnoses: {diagnosis_result}")
+    events.emit('diagnosis', bank_version=bank.version, diagnoses=valid_diagnoses)
+    record_result(session, bank, answers, valid_diagnoses)
     return render_template('assessment.html', result=diagnosis_result)
 
+@app.route('/api/score/batch', methods=['POST'])
+@app.route('/i/<instrument>/api/score/batch', methods=['POST'])
+def score_batch():
+    bank = registry_for(g.instrument).current()
+    def generate():
+        for result in iter_scored(request.stream, bank):
+            yield json.dumps(result) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/assessment')
+@app.route('/i/<instrument>/assessment')
+def assessment_app():
+    return render_template('assessment_app.html', questions_version=registry_for(g.instrument).current().version)
+
+@app.route('/api/instruments')
+def api_instruments():
+    return jsonify({"default": instrument_registry.default_name,
+                    "instruments": instrument_registry.names(),
+                    "loaded": instrument_registry.loaded()})
+
+@app.route('/api/questions')
+@app.route('/i/<instrument>/api/questions')
+def api_questions():
+    return questions_response(request, g.instrument)
+
+@app.route('/api/answers', methods=['POST'])
+@app.route('/i/<instrument>/api/answers', methods=['POST'])
+def api_answers():
+    body, status = update_answers(session, request.get_json(silent=True), g.instrument)
+    return jsonify(body), status
+
+@app.route('/api/result')
+@app.route('/i/<instrument>/api/result')
+def api_result():
+    body, status = assessment_result(session, g.instrument)
+    return jsonify(body), status
+
+# The JSON API is written against explicit request/session objects so the
+# ASGI entry point (asgi.py) can serve it without a Flask request context.
+def questions_response(req, instrument=None):
+    registry = registry_for(instrument)
+    bank = registry.get(req.args.get('v')) or registry.current()
+    response = Response(bank.payload, mimetype='application/json')
+    response.set_etag(bank.version)
+    if req.args.get('v') == bank.version:
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(req)
+
+def update_answers(sess, data, instrument=None):
+    if not isinstance(data, dict) or not isinstance(data.get('answers', {}), dict):
+        return {"error": "Expected a JSON object with an 'answers' mapping."}, 400
+    # Answering another instrument's questions starts over, as a reset does.
+    if data.get('reset') or sess.get('instrument') != instrument:
+        # Pin the session to the bank version the client is displaying.
+        registry = registry_for(instrument)
+        bank = registry.get(data.get('version')) or registry.current()
+        if instrument is None:
+            sess.pop('instrument', None)
+        else:
+            sess['instrument'] = instrument
+        sess['bank_version'] = bank.version
+        sess.pop('adaptive', None)
+        answers = {}
+    else:
+        bank = bank_for(sess, instrument)
+        answers = sess.get('answers', {})
+    for symptom, severity in data.get('answers', {}).items():
+        i = bank.graph.ids.get(symptom)
+        if i is None or not isinstance(severity, str):
+            return {"error": f"Invalid answer for '{symptom}'."}, 400
+        answers[symptom] = record_answer(bank.questions[i], severity)
+    sess['answers'] = answers
+    # Let the form flow rebuild its navigation masks from the updated answers.
+    sess.pop('answered_mask', None)
+    sess.pop('yes_mask', None)
+    sess.pop('result_recorded', None)
+    sess.pop('tally', None)
+    return {"answered": len(answers)}, 200
+
+def assessment_result(sess, instrument=None):
+    if sess.get('instrument') != instrument:
+        return {"error": "No assessment of this instrument is in progress."}, 400
+    bank = bank_for(sess, instrument)
+    answers = sess.get('answers', {})
+    severities = {
+        symptom: ans['severity']
+        for symptom, ans in answers.items()
+        if not ans.get('was_skipped', False)
+    }
+    try:
+        replayed = bank.replay_answers(severities)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    diagnoses = bank.rules.diagnose(replayed)
+    events.emit('diagnosis', bank_version=bank.version, diagnoses=diagnoses)
+    record_result(sess, bank, replayed, diagnoses)
+    return {"diagnoses": diagnoses}, 200
+
+def record_result(sess, bank, answers, diagnoses):
+    # Reloading the result page must not count the same assessment twice.
+    if result_store is None or sess.get('result_recorded'):
+        return
+    instrument = sess.get('instrument') or instrument_registry.default_name
+    result_store.record(instrument, bank.version, answers, diagnoses)
+    sess['result_recorded'] = True
+
+@app.route('/api/preview')
+@app.route('/i/<instrument>/api/preview')
+def api_preview():
+    if session.get('instrument') != g.instrument:
+        return jsonify({"error": "No assessment of this instrument is in progress."}), 400
+    bank = bank_for(session, g.instrument)
+    answers = session.get('answers', {})
+    tally = session_tally(session, bank, answers)
+    session['tally'] = tally
+    return jsonify({"rules": bank.rules.preview(tally)})
+
+@app.route('/api/stats')
+@app.route('/i/<instrument>/api/stats')
+def api_stats():
+    if result_store is None:
+        return jsonify({"error": "Result storage is disabled."}), 404
+    since, until = request.args.get('since'), request.args.get('until')
+    for day in (since, until):
+        if day is not None:
+            try:
+                time.strptime(day, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({"error": "Dates must be given as YYYY-MM-DD."}), 400
+    return jsonify(result_store.stats(g.instrument or instrument_registry.default_name, since, until))
+
+@app.route('/tree', defaults={'graph': 'full'})
+@app.route('/tree/<graph>')
+def decision_tree(graph):
+    bank = bank_registry.current()
+    # The SVG only depends on the bank version, so revalidation never renders.
+    etag = graph_etag(bank.version, graph)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            svg = diagram_cache.get((bank.version, graph), lambda: render_svg(graph, bank.questions))
+        except KeyError:
+            return Response(f"Unknown diagram '{graph}'.", status=404, mimetype='text/plain')
+        except RenderError as e:
+            logging.error(f"Error rendering diagram '{graph}': {e}")
+            return Response("Diagram rendering is unavailable.", status=503, mimetype='text/plain')
+        response = Response(svg, mimetype='image/svg+xml')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     logging.error(f"Unhandled exception: {e}")
     return render_template('assessment.html', error="An unexpected error occurred. Please try again later."), 500
 
+def warm_up():
+    """Compile the templates and the bank's first adaptive step ahead of the first request.
+
+    gunicorn.conf.py calls this in the master when the app is preloaded, so
+    forked workers start with the work already done.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    bank_registry.current().planner.next_question({})
+
 if __name__ != '__main__':
     logging.info("App loaded in production mode.")
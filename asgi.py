@@ -0,0 +1,231 @@
+"""ASGI entry point serving the same routes as app.py on an asyncio event loop.
+
+The JSON assessment API (/api/questions, /api/answers, /api/result) is served
+natively: scoring runs on the loop and only session store I/O is handed to a
+thread pool. Every other route (the form flow, static files, batch scoring)
+is delegated to the Flask WSGI app on the same pool.
+
+    uvicorn asgi:application --workers 4
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wrappers import Request, Response
+
+import metrics
+from app import app, assessment_result, questions_response, update_answers
+
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_THREADS', 32)))
+# Body chunks a delegated Flask response may have in flight before its thread waits for the client.
+WSGI_QUEUE_CHUNKS = 8
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def open_session(request):
+    return await run_blocking(app.session_interface.open_session, app, request)
+
+
+async def save_session(session, response):
+    await run_blocking(app.session_interface.save_session, app, session, response)
+
+
+def json_response(body, status):
+    return Response(app.json.dumps(body), status=status, mimetype='application/json')
+
+
+async def api_questions(request):
+    return questions_response(request)
+
+
+async def api_answers(request):
+    session = await open_session(request)
+    response = json_response(*update_answers(session, request.get_json(silent=True)))
+    await save_session(session, response)
+    return response
+
+
+async def api_result(request):
+    session = await open_session(request)
+    response = json_response(*assessment_result(session))
+    await save_session(session, response)
+    return response
+
+
+routes = {
+    ('GET', '/api/questions'): api_questions,
+    ('POST', '/api/answers'): api_answers,
+    ('GET', '/api/result'): api_result,
+}
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def send_response(send, response):
+    body = response.get_data()
+    headers = [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in response.headers.items()
+    ]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class _ClientGone(Exception):
+    pass
+
+
+async def send_wsgi_response(send, environ):
+    """Run the Flask app on the pool and send its body as it is produced.
+
+    The whole iteration stays on one pool thread, which keeps Flask's
+    context locals (stream_with_context) valid. Chunks reach the loop
+    through a small bounded queue, so a streaming response such as
+    /api/score/batch is never held in memory as a whole.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # Free queue slots; the pool thread waits on it, the loop only releases it.
+    slots = threading.Semaphore(WSGI_QUEUE_CHUNKS)
+    abandoned = threading.Event()
+
+    def put(item):
+        slots.acquire()
+        if abandoned.is_set():
+            raise _ClientGone()
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def produce():
+        try:
+            iterable = app(environ, lambda status, headers, exc_info=None: put(('start', status, headers)))
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        except _ClientGone:
+            return
+        put(('end',))
+
+    producer = asyncio.ensure_future(run_blocking(produce))
+    started = False
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                # The producer finished without an end marker: it raised.
+                getter.cancel()
+                await producer
+            item = getter.result()
+            slots.release()
+            if item[0] == 'start':
+                _, status, headers = item
+                await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                        for name, value in headers]})
+                started = True
+            elif item[0] == 'body':
+                await send({'type': 'http.response.body', 'body': item[1], 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+    except Exception as e:
+        logging.error(f"Unhandled exception: {e}")
+        if not started:
+            await send_response(send, Response("Internal Server Error", status=500, mimetype='text/plain'))
+    finally:
+        abandoned.set()
+        # Wake a producer waiting for a slot so it sees the flag and stops.
+        slots.release()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    handler = routes.get((scope['method'], scope['path']))
+    if handler is None:
+        # The rest of the app is synchronous Flask code; it runs on the pool.
+        await send_wsgi_response(send, environ)
+        return
+    request = Request(environ)
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+    except Exception as e:
+        logging.error(f"Unhandled exception: {e}")
+        response = json_response({"error": "An unexpected error occurred. Please try again later."}, 500)
+    # Routes delegated to Flask are measured by the app's own hooks.
+    metrics.record_response(scope['method'], scope['path'], response,
+                            time.perf_counter() - started, app.config['SESSION_COOKIE_NAME'])
+    await send_response(send, response)
@@ -0,0 +1,64 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are not worth compressing.
+MIN_COMPRESS_BYTES = 512
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+class Asset:
+    """One static file held in memory with its content hash and compressed variants."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        self.variants = compress_variants(data, self.mimetype)
+
+
+def compress_variants(data, mimetype):
+    """{content-encoding: body}; the identity encoding is keyed by None."""
+    variants = {None: data}
+    if len(data) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+        variants['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants['br'] = brotli.compress(data)
+    return variants
+
+
+def choose_encoding(variants, accept_encoding):
+    """Best variant the client accepts: br, then gzip, then identity."""
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accept_encoding[encoding]:
+            return encoding
+    return None
+
+
+class AssetManifest:
+    """Fingerprinted copies of the files in ``static_folder``, built once at startup."""
+
+    def __init__(self, static_folder):
+        self.assets = {}
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    self.assets[filename] = Asset(filename, f.read())
+
+    def url(self, filename):
+        asset = self.assets.get(filename)
+        if asset is None:
+            return f"/static/{filename}"
+        return f"/assets/{asset.digest}/{filename}"
+
+    def get(self, digest, filename):
+        asset = self.assets.get(filename)
+        return asset if asset is not None and asset.digest == digest else None
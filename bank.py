@@ -0,0 +1,266 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import engine
+from engine import (
+    SEVERITY_SEVERE, SEVERITY_YES, AdaptivePlanner, CompiledRules, QuestionGraph, question_weight,
+    replay_answers, validate_answer, validation_message
+)
+
+QUESTIONS_PATH = os.environ.get('QUESTIONS_PATH', 'questions.json')
+RULES_PATH = os.environ.get('RULES_PATH', 'rules.json')
+CACHE_DIR = os.environ.get('BANK_CACHE_DIR', '.bank_cache')
+# Bumped whenever the compiled layout changes so stale pickles are ignored.
+CACHE_FORMAT = 4
+# What content_version() produces; anything else never reaches the cache directory.
+VERSION_RE = re.compile(r'[0-9a-f]{16}')
+
+
+class Bank:
+    """One immutable, compiled version of the question bank and diagnosis rules."""
+
+    def __init__(self, version, questions, diagnosis_rules, validation_rules):
+        self.version = version
+        self.questions = questions
+        self.validation_rules = validation_rules
+
+        # Initialize question weights (using "Severe" as the default severity)
+        for q in questions:
+            binary = q.get("binary", False)
+            q["question_weight"] = question_weight(
+                len(q["dsm_codes"]),
+                SEVERITY_YES if binary else SEVERITY_SEVERE,
+                binary
+            )
+
+        self.graph = QuestionGraph(questions)
+        self.rules = CompiledRules(diagnosis_rules)
+        self.planner = AdaptivePlanner(questions, self.graph, self.rules)
+        # The client-side flow gets the whole bank in one cacheable document.
+        self.payload = json.dumps({
+            "version": version,
+            "questions": [
+                {
+                    "symptom": q["symptom"],
+                    "question": q["question"],
+                    "dsm_codes": q.get("dsm_codes", []),
+                    "binary": q.get("binary", False),
+                    "dependencies": [self.graph.symptoms[d] for d in self.graph.dependencies[i]],
+                    "question_weight": q["question_weight"]
+                }
+                for i, q in enumerate(questions)
+            ],
+            "validation_rules": validation_rules
+        }, separators=(',', ':'))
+
+    def validate_answer(self, symptom, answer, answers):
+        return validate_answer(symptom, answer, answers, self.validation_rules)
+
+    def validation_message(self, symptom):
+        return validation_message(symptom, self.validation_rules)
+
+    def replay_answers(self, severities):
+        return replay_answers(self.questions, severities, self.validation_rules)
+
+
+def scoring_constants():
+    """engine.py's scoring constants, serialized; compiled banks bake in values derived from them."""
+    return json.dumps([
+        engine.SEVERITY_ADJUSTMENT, engine.SYMPTOM_THRESHOLD, engine.CERTAINTY_THRESHOLD,
+        engine.BASE_WEIGHT, engine.WEIGHT_REDUCTION, engine.MIN_WEIGHT,
+        sorted([list(key), weight] for key, weight in engine.WEIGHT_TABLE.items()),
+    ], sort_keys=True).encode()
+
+
+def content_version(*blobs):
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(hashlib.sha256(blob).digest())
+    return digest.hexdigest()[:16]
+
+
+def load_bank(questions_path=QUESTIONS_PATH, rules_path=RULES_PATH, cache_dir=CACHE_DIR):
+    """Load a Bank, reusing the compiled form cached on disk for the same content hash."""
+    with open(questions_path, 'rb') as f:
+        questions_blob = f.read()
+    with open(rules_path, 'rb') as f:
+        rules_blob = f.read()
+    # A change to the scoring constants is a new version too, so stale pickles are never reused.
+    version = content_version(questions_blob, rules_blob, scoring_constants())
+
+    bank = load_cached(version, cache_dir)
+    if bank is not None:
+        return bank
+
+    rules = json.loads(rules_blob)
+    bank = Bank(
+        version,
+        json.loads(questions_blob),
+        rules["diagnosis_rules"],
+        rules.get("validation_rules", [])
+    )
+    if cache_dir:
+        write_cache(bank, cache_dir)
+    return share_components(bank)
+
+
+# Compiled structures keyed by the data they are built from. Banks loaded in
+# the same process (other instruments, other versions) that would compile an
+# identical structure use the one already in memory instead.
+_shared = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+def _share(key, value):
+    with _shared_lock:
+        existing = _shared.get(key)
+        if existing is None:
+            _shared[key] = value
+            return value
+        return existing
+
+
+def share_components(bank):
+    """Intern the bank's symptom names and DSM codes and reuse identical compiled parts.
+
+    A translation of an instrument differs only in question text and
+    messages, so it ends up sharing the graph, rules and planner of the
+    original; a shorter form that reuses the symptom names shares the strings.
+    """
+    for q in bank.questions:
+        q['symptom'] = sys.intern(q['symptom'])
+        q['dsm_codes'] = [sys.intern(code) for code in q.get('dsm_codes', [])]
+        if 'dependency' in q:
+            q['dependency'] = sys.intern(q['dependency'])
+        if 'dependencies' in q:
+            q['dependencies'] = [sys.intern(dep) for dep in q['dependencies']]
+
+    graph_key = ('graph', bank.graph.symptoms, bank.graph.dependencies)
+    rules_digest = hashlib.sha256(json.dumps(bank.rules.rules, sort_keys=True).encode()).hexdigest()
+    rules_key = ('rules', rules_digest)
+    planner_key = ('planner', graph_key, rules_digest,
+                   tuple((len(q['dsm_codes']), q.get('binary', False)) for q in bank.questions))
+    bank.graph = _share(graph_key, bank.graph)
+    bank.rules = _share(rules_key, bank.rules)
+    # The planner only reads the graph and rules it was built over, which are equal to the shared ones.
+    bank.planner.graph = bank.graph
+    bank.planner.rules = bank.rules
+    bank.planner = _share(planner_key, bank.planner)
+    return bank
+
+
+def cache_path(version, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{version}.{CACHE_FORMAT}.pickle")
+
+
+def load_cached(version, cache_dir=CACHE_DIR):
+    if not cache_dir or not isinstance(version, str) or not VERSION_RE.fullmatch(version):
+        return None
+    try:
+        with open(cache_path(version, cache_dir), 'rb') as f:
+            bank = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return share_components(bank) if getattr(bank, 'version', None) == version else None
+
+
+def write_cache(bank, cache_dir=CACHE_DIR):
+    # Write to a temporary file and rename so concurrent workers never read a partial pickle.
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(bank, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path(bank.version, cache_dir))
+    except OSError as e:
+        logging.warning(f"Could not cache compiled bank {bank.version}: {e}")
+
+
+class BankRegistry:
+    """Serves the current bank and swaps to a new version when the data files change.
+
+    The files are stat'ed at most once per ``check_interval`` seconds. Older
+    versions stay available through ``get()`` so sessions stay pinned to the
+    version they started on: recent ones from memory, older ones from the
+    on-disk cache.
+    """
+
+    def __init__(self, questions_path=QUESTIONS_PATH, rules_path=RULES_PATH,
+                 cache_dir=CACHE_DIR, check_interval=2.0, keep=8):
+        self.questions_path = questions_path
+        self.rules_path = rules_path
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        self._signature = self._stat()
+        self._current = self._remember(load_bank(questions_path, rules_path, cache_dir))
+        self._checked = time.monotonic()
+
+    def _stat(self):
+        signature = []
+        for path in (self.questions_path, self.rules_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _remember(self, bank):
+        self._versions[bank.version] = bank
+        self._versions.move_to_end(bank.version)
+        while len(self._versions) > self.keep:
+            self._versions.popitem(last=False)
+        return bank
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self.reload()
+        return self._current
+
+    def reload(self):
+        with self._lock:
+            signature = self._stat()
+            if signature == self._signature:
+                return self._current
+            try:
+                bank = load_bank(self.questions_path, self.rules_path, self.cache_dir)
+            except Exception as e:
+                # Keep serving the last good version while the files are being edited.
+                logging.error(f"Error reloading question bank: {e}")
+                return self._current
+            self._signature = signature
+            if bank.version != self._current.version:
+                logging.info(f"Question bank updated to version {bank.version}.")
+                self._current = self._remember(bank)
+            return self._current
+
+    def get(self, version):
+        """Return the bank for ``version``, or None if it is no longer available.
+
+        ``version`` often comes straight from a client, so it is checked to
+        look like a version before memory or the disk cache is consulted.
+        """
+        if not isinstance(version, str) or not VERSION_RE.fullmatch(version):
+            return None
+        bank = self._versions.get(version)
+        if bank is None:
+            bank = load_cached(version, self.cache_dir)
+            if bank is not None:
+                with self._lock:
+                    self._remember(bank)
+        return bank
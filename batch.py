@@ -0,0 +1,186 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from bank import QUESTIONS_PATH, RULES_PATH, load_bank
+
+
+def score_answer_set(bank, severities):
+    """Score one complete answer set (symptom -> severity) like a finished session."""
+    answers = bank.replay_answers(severities)
+    return bank.rules.diagnose(answers)
+
+
+def score_record(bank, record, line_no):
+    record_id = record.get("id", line_no) if isinstance(record, dict) else line_no
+    answers = record.get("answers") if isinstance(record, dict) else None
+    if not isinstance(answers, dict) or not all(isinstance(v, str) for v in answers.values()):
+        return {"id": record_id, "error": "Expected an object with an 'answers' mapping of symptom to severity."}
+    try:
+        diagnoses = score_answer_set(bank, answers)
+    except ValueError as e:
+        return {"id": record_id, "error": str(e)}
+    return {"id": record_id, "diagnoses": diagnoses}
+
+
+def score_line(bank, line, line_no):
+    """Score one JSONL line; returns None for blank lines."""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.strip():
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": line_no, "error": f"Invalid JSON: {e}"}
+    return score_record(bank, record, line_no)
+
+
+def iter_scored(lines, bank):
+    """Yield one result per non-blank JSONL line, in input order.
+
+    Each line is ``{"id": ..., "answers": {"<symptom>": "<severity>", ...}}``;
+    ``id`` defaults to the 1-based line number.
+    """
+    for line_no, line in enumerate(lines, 1):
+        result = score_line(bank, line, line_no)
+        if result is not None:
+            yield result
+
+
+def iter_csv_records(f):
+    """Yield (row number, record) from a CSV with one column per symptom.
+
+    An optional ``id`` column names the row; empty cells count as "No".
+    """
+    for row_no, row in enumerate(csv.DictReader(f), 1):
+        record_id = row.pop("id", None) or row_no
+        yield row_no, {"id": record_id, "answers": {k: v for k, v in row.items() if k and v}}
+
+
+# Set once per worker process by _init_worker so tasks only carry answer data.
+_worker_bank = None
+
+
+def _init_worker(questions_path, rules_path):
+    global _worker_bank
+    _worker_bank = load_bank(questions_path, rules_path)
+
+
+def _score_chunk(fmt, chunk):
+    if fmt == "csv":
+        return [score_record(_worker_bank, record, row_no) for row_no, record in chunk]
+    results = (score_line(_worker_bank, line, line_no) for line_no, line in chunk)
+    return [r for r in results if r is not None]
+
+
+class Progress:
+    def __init__(self, stream=sys.stderr, interval=2.0):
+        self.stream = stream
+        self.interval = interval
+        self.count = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, n):
+        self.count += n
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None, final=False):
+        elapsed = (now or time.monotonic()) - self.started
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        label = "done" if final else "progress"
+        self.stream.write(f"[{label}] {self.count} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)\n")
+        self.stream.flush()
+
+
+def score_parallel(items, fmt, questions_path, rules_path, workers=None, chunk_size=2000,
+                   progress=None):
+    """Score (line number, item) pairs across a process pool, yielding results in input order.
+
+    At most ``2 * workers`` chunks are in flight, so memory stays bounded
+    however large the input is.
+    """
+    # Imported here so the app, which only scores serially, does not load multiprocessing.
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(questions_path, rules_path)) as pool:
+        for chunk in chunks:
+            pending.append(pool.submit(_score_chunk, fmt, chunk))
+            if len(pending) >= 2 * workers:
+                yield from _drain(pending.popleft(), progress)
+        while pending:
+            yield from _drain(pending.popleft(), progress)
+
+
+def _drain(future, progress):
+    results = future.result()
+    if progress:
+        progress.update(len(results))
+    return results
+
+
+def _score_serial(bank, fmt, items, progress):
+    for line_no, item in items:
+        if fmt == "csv":
+            result = score_record(bank, item, line_no)
+        else:
+            result = score_line(bank, item, line_no)
+        if result is None:
+            continue
+        if progress:
+            progress.update(1)
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score answer sets from a JSONL or CSV file.")
+    parser.add_argument("input", help="JSONL or CSV file of answer sets, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Question bank to replay against")
+    parser.add_argument("--rules", default=RULES_PATH, help="Diagnosis and validation rules")
+    parser.add_argument("--format", choices=["jsonl", "csv"],
+                        help="Input format (default: from the file extension, else jsonl)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Worker processes; 0 uses every CPU (default: 1, no pool)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Rows per worker task")
+    parser.add_argument("--progress", action="store_true", help="Report throughput on stderr")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    src = sys.stdin if args.input == "-" else open(args.input, "r", newline="")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w")
+    progress = Progress() if args.progress else None
+    try:
+        items = iter_csv_records(src) if fmt == "csv" else enumerate(src, 1)
+        if args.workers == 1:
+            bank = load_bank(args.questions, args.rules)
+            results = _score_serial(bank, fmt, items, progress)
+        else:
+            results = score_parallel(items, fmt, args.questions, args.rules, args.workers or None,
+                                     args.chunk_size, progress)
+        for result in results:
+            dst.write(json.dumps(result) + "\n")
+        if progress:
+            progress.report(final=True)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# The app refuses to import without a secret key; benchmarks use a throwaway one.
+os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark-only-secret')
+# Synthetic assessments must not end up in the real result store or event log.
+os.environ['RESULTS_PATH'] = ''
+os.environ['EVENTS_SINK'] = 'off'
+
+import app as app_module
+from bank import BankRegistry
+from sessions import configure_sessions
+
+
+def timeit(func, repeat):
+    """Run ``func`` ``repeat`` times and summarise the wall-clock timings."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "repeat": repeat,
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def synthetic_bank(n_questions, seed=0):
+    """Return (questions, rules) shaped like the real bank but with ``n_questions`` items."""
+    rnd = random.Random(seed)
+    n_disorders = max(7, n_questions // 10)
+    codes = [f"{900 + i // 100}.{i % 100:02d}" for i in range(n_disorders)]
+    questions = []
+    for i in range(n_questions):
+        q = {
+            "symptom": f"symptom_{i}",
+            "question": f"Synthetic question {i}?",
+            "dsm_codes": rnd.sample(codes, rnd.choice([1, 1, 2, 3])),
+        }
+        if i and rnd.random() < 0.15:
+            q["binary"] = True
+        if i > 2 and rnd.random() < 0.2:
+            deps = rnd.sample(range(i), min(i, rnd.choice([1, 2])))
+            if len(deps) == 1:
+                q["dependency"] = f"symptom_{deps[0]}"
+            else:
+                q["dependencies"] = [f"symptom_{d}" for d in deps]
+        questions.append(q)
+
+    diagnosis_rules = []
+    for code in codes:
+        symptoms = [q["symptom"] for q in questions if code in q["dsm_codes"]]
+        if not symptoms:
+            continue
+        if len(symptoms) >= 4 and rnd.random() < 0.3:
+            symptoms = [{"any_of": symptoms[:2]}] + symptoms[2:]
+        diagnosis_rules.append({"name": f"Synthetic disorder {code}", "dsm_code": code, "symptoms": symptoms})
+    # Placed on the last two questions so random walks still cover the whole bank.
+    validation_rules = [{
+        "symptoms": [f"symptom_{n_questions - 2}", f"symptom_{n_questions - 1}"],
+        "condition": "not_simultaneous",
+        "message": "Synthetic validation rule."
+    }]
+    return questions, {"diagnosis_rules": diagnosis_rules, "validation_rules": validation_rules}
+
+
+def use_bank(questions_path, rules_path):
+    """Point the app (and its session codec) at a different question bank."""
+    registry = BankRegistry(questions_path, rules_path, cache_dir=None, check_interval=3600)
+    app_module.bank_registry = registry
+    configure_sessions(app_module.app, registry)
+    return registry
+
+
+def write_synthetic_bank(directory, n_questions, seed):
+    questions, rules = synthetic_bank(n_questions, seed)
+    questions_path = os.path.join(directory, f"questions_{n_questions}.json")
+    rules_path = os.path.join(directory, f"rules_{n_questions}.json")
+    with open(questions_path, "w") as f:
+        json.dump(questions, f)
+    with open(rules_path, "w") as f:
+        json.dump(rules, f)
+    return questions_path, rules_path
+
+
+def session_cookie_size(client):
+    cookie = client.get_cookie(app_module.app.config["SESSION_COOKIE_NAME"])
+    return len(cookie.value) if cookie else 0
+
+
+def random_severity(rnd, html):
+    if b"Mild" in html:
+        return rnd.choice(["None", "Mild", "Moderate", "Severe"])
+    return rnd.choice(["None", "Yes"])
+
+
+def answer_question(client, rnd, html):
+    """POST a random answer; returns (response, requests made).
+
+    An answer the bank's validation_rules reject (say manic_episode and
+    depressed_mood both present) comes back as the error page without being
+    stored, so it is re-answered "None" the way a user would correct it,
+    rather than ending the walk early.
+    """
+    response = client.post("/ask", data={"severity": random_severity(rnd, html)})
+    if b"<h2>Error</h2>" not in response.data:
+        return response, 1
+    return client.post("/ask", data={"severity": "None"}), 2
+
+
+def walk_assessment(client, rnd, back_probability=0.0, cookie_sizes=None, rejected=None):
+    """Walk /start -> /ask until a result or error page; returns the number of requests.
+
+    Answers rejected by validation are retried (see ``answer_question``) and
+    counted in ``rejected`` when a list is given.
+    """
+    client.get("/start")
+    response = client.get("/ask")
+    requests = 2
+    while b"Diagnosis Result" not in response.data and b"<h2>Error</h2>" not in response.data:
+        if back_probability and rnd.random() < back_probability:
+            response = client.get("/ask?direction=back", follow_redirects=True)
+            requests += 2
+        else:
+            response, made = answer_question(client, rnd, response.data)
+            requests += made
+            if rejected is not None and made > 1:
+                rejected.append(1)
+        if cookie_sizes is not None:
+            cookie_sizes.append(session_cookie_size(client))
+    return requests
+
+
+def bench_walkthrough(rnd, repeat):
+    client = app_module.app.test_client()
+    requests = []
+    rejected = []
+    result = timeit(lambda: requests.append(walk_assessment(client, rnd, rejected=rejected)), repeat)
+    result["requests_per_walk"] = statistics.fmean(requests)
+    result["rejected_per_walk"] = len(rejected) / len(requests)
+    result["per_request_ms"] = result["mean_ms"] / result["requests_per_walk"]
+    return result
+
+
+def bench_cookie_sizes(rnd):
+    client = app_module.app.test_client()
+    sizes = []
+    walk_assessment(client, rnd, cookie_sizes=sizes)
+    return {"steps": len(sizes), "max_bytes": max(sizes, default=0),
+            "mean_bytes": statistics.fmean(sizes) if sizes else 0, "per_step_bytes": sizes}
+
+
+def bench_back_storm(rnd, repeat, depth=10, hops=50):
+    """Answer ``depth`` questions, then alternate back hops and re-answers."""
+    client = app_module.app.test_client()
+
+    def storm():
+        client.get("/start")
+        response = client.get("/ask")
+        for _ in range(depth):
+            response, _ = answer_question(client, rnd, response.data)
+        for _ in range(hops):
+            response = client.get("/ask?direction=back", follow_redirects=True)
+            if rnd.random() < 0.5:
+                response, _ = answer_question(client, rnd, response.data)
+
+    result = timeit(storm, repeat)
+    result["per_hop_ms"] = result["mean_ms"] / hops
+    return result
+
+
+def random_answers(bank, rnd):
+    answers = {}
+    for q in bank.questions:
+        severity = rnd.choice(["None", "Yes"] if q.get("binary") else ["None", "Mild", "Moderate", "Severe"])
+        answers[q["symptom"]] = severity
+    try:
+        return bank.replay_answers(answers)
+    except ValueError:
+        for rule in bank.validation_rules:
+            answers[rule["symptoms"][0]] = "None"
+        return bank.replay_answers(answers)
+
+
+def bench_diagnosis(rnd, repeat, sets=200):
+    bank = app_module.bank_registry.current()
+    answer_sets = [random_answers(bank, rnd) for _ in range(sets)]
+    engine_only = timeit(lambda: [bank.rules.diagnose(a) for a in answer_sets], repeat)
+    engine_only["per_call_us"] = engine_only["mean_ms"] * 1000 / sets
+
+    # generate_diagnosis() as the app calls it, including the result page render.
+    def render_all():
+        for answers in answer_sets:
+            with app_module.app.test_request_context("/ask"):
+                app_module.session["answers"] = answers
+                app_module.generate_diagnosis(bank)
+
+    rendered = timeit(render_all, repeat)
+    rendered["per_call_us"] = rendered["mean_ms"] * 1000 / sets
+    return {"engine": engine_only, "generate_diagnosis": rendered}
+
+
+def run_suite(rnd, repeat):
+    return {
+        "walkthrough": bench_walkthrough(rnd, repeat),
+        "diagnosis": bench_diagnosis(rnd, repeat),
+        "back_storm": bench_back_storm(rnd, repeat),
+        "cookie_size": bench_cookie_sizes(rnd),
+    }
+
+
+# Run in a fresh interpreter per sample: imports the app, then times the first
+# /start -> /ask. With COLD_START_FORKS set it instead preloads and warms the
+# app once and times forked children the way gunicorn.conf.py starts workers.
+COLD_START_SCRIPT = r"""
+import gc, json, os, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+def first_request():
+    client = app.app.test_client()
+    client.get("/start")
+    client.get("/ask")
+
+forks = int(os.environ.get("COLD_START_FORKS", 0))
+if not forks:
+    first_request()
+    print(json.dumps({"import_ms": (imported - started) * 1000,
+                      "first_request_ms": (time.perf_counter() - imported) * 1000}))
+    sys.exit()
+app.warm_up()
+gc.freeze()
+samples = []
+for _ in range(forks):
+    r, w = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        first_request()
+        os.write(w, str((time.perf_counter() - forked) * 1000).encode())
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r) as f:
+        samples.append(float(f.read()))
+    os.waitpid(pid, 0)
+print(json.dumps({"worker_ready_ms": samples}))
+"""
+
+
+def run_cold_start(env):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT], env=env, capture_output=True,
+                         text=True, check=True).stdout
+    result = json.loads(out.splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summarise(samples):
+    return {"repeat": len(samples), "min_ms": min(samples), "median_ms": statistics.median(samples),
+            "max_ms": max(samples)}
+
+
+def bench_cold_start(repeat):
+    """Time from a new process (or a forked preloaded worker) to its first answered request."""
+    env = dict(os.environ, RESULTS_PATH="", EVENTS_SINK="off", PROFILE_SAMPLE_RATE="0")
+    env.pop("METRICS_DIR", None)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_env = dict(env, BANK_CACHE_DIR=os.path.join(tmp, "snapshot"))
+        run_cold_start(snapshot_env)  # writes the compiled bank snapshot
+        for name, make_env in (
+            ("snapshot", lambda i: snapshot_env),
+            # A fresh cache directory every run compiles the bank from JSON.
+            ("no_snapshot", lambda i: dict(env, BANK_CACHE_DIR=os.path.join(tmp, f"empty-{i}"))),
+        ):
+            runs = [run_cold_start(make_env(i)) for i in range(repeat)]
+            results[name] = {key: summarise([run[key] for run in runs])
+                             for key in ("process_ms", "import_ms", "first_request_ms")}
+        forked = run_cold_start(dict(snapshot_env, COLD_START_FORKS=str(repeat)))
+        results["preload_fork"] = {"worker_ready_ms": summarise(forked["worker_ready_ms"])}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the assessment hot paths.")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per benchmark")
+    parser.add_argument("--sizes", default="50,500,5000",
+                        help="Comma-separated synthetic bank sizes for the scaling curves")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cold-start", type=int, default=5,
+                        help="Fresh processes per cold-start measurement (0 skips it)")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    rnd = random.Random(args.seed)
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "bank": run_suite(rnd, args.repeat),
+        "scaling": {},
+    }
+    if args.cold_start:
+        results["cold_start"] = bench_cold_start(args.cold_start)
+
+    default_registry = app_module.bank_registry
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(",") if s]:
+            use_bank(*write_synthetic_bank(tmp, size, args.seed))
+            # Large banks make each walk proportionally longer; keep total time bounded.
+            repeat = max(1, min(args.repeat, 5000 // size))
+            results["scaling"][str(size)] = {
+                "walkthrough": bench_walkthrough(rnd, repeat),
+                "diagnosis": bench_diagnosis(rnd, repeat, sets=20),
+                "back_storm": bench_back_storm(rnd, repeat),
+                "cookie_max_bytes": bench_cookie_sizes(rnd)["max_bytes"],
+            }
+            print(f"scaling: {size} questions done", file=sys.stderr)
+    app_module.bank_registry = default_registry
+    configure_sessions(app_module.app, default_registry)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class RenderCache:
+    """LRU of rendered diagrams where concurrent misses for a key share one render."""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._inflight = {}
+
+    def get(self, key, render):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            value = render()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(value)
+            with self._lock:
+                self._items[key] = value
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+def graph_etag(version, graph):
+    return hashlib.sha256(f"{version}\0{graph}".encode()).hexdigest()[:16]
+
+
+def build_dot(graph, questions):
+    """DOT graph for 'full', 'simple' or a DSM code; KeyError if there is no such graph."""
+    # Imported on first use so serving the assessment never loads graphviz.
+    import tree_gen
+
+    if graph == 'full':
+        return tree_gen.create_decision_tree(questions)
+    if graph == 'simple':
+        return tree_gen.create_simplified_tree(questions)
+    if graph not in tree_gen.define_disorders():
+        raise KeyError(graph)
+    return tree_gen.create_disorder_specific_tree(graph, questions)
+
+
+class RenderError(Exception):
+    pass
+
+
+def render_svg(graph, questions):
+    try:
+        import graphviz
+    except ImportError as e:
+        raise RenderError(f"graphviz Python package is not installed: {e}") from e
+
+    try:
+        return build_dot(graph, questions).pipe(format='svg')
+    except (graphviz.ExecutableNotFound, graphviz.CalledProcessError) as e:
+        raise RenderError(str(e)) from e
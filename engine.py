@@ -0,0 +1,632 @@
+import math
+
+SEVERITY_ADJUSTMENT = {
+    "severe": 1.0,
+    "moderate": 0.75,
+    "mild": 0.5
+}
+
+# Answers store a small integer severity code instead of the submitted string.
+# "No"/"None"/"" all mean the symptom is absent; any unrecognised string counts
+# as present with no weight, exactly as calculate_question_weight treats it.
+SEVERITY_NONE, SEVERITY_MILD, SEVERITY_MODERATE, SEVERITY_SEVERE, SEVERITY_YES, SEVERITY_OTHER = range(6)
+SEVERITY_NAMES = ["None", "Mild", "Moderate", "Severe", "Yes", "Other"]
+SEVERITY_CODES = {
+    "no": SEVERITY_NONE,
+    "none": SEVERITY_NONE,
+    "": SEVERITY_NONE,
+    "mild": SEVERITY_MILD,
+    "moderate": SEVERITY_MODERATE,
+    "severe": SEVERITY_SEVERE,
+    "yes": SEVERITY_YES,
+}
+
+# Share of a disorder's symptoms that must be present, and the minimum
+# certainty (in percent) a diagnosis needs to be reported.
+SYMPTOM_THRESHOLD = 0.7
+CERTAINTY_THRESHOLD = 40
+
+# A question's weight starts at BASE_WEIGHT and loses WEIGHT_REDUCTION for
+# every DSM code after the first, but never drops below MIN_WEIGHT.
+BASE_WEIGHT = 0.9
+WEIGHT_REDUCTION = 0.2
+MIN_WEIGHT = 0.5
+
+
+def calculate_question_weight(dsm_codes, severity, binary=False):
+    severity_norm = severity.lower()
+    if severity_norm in ['no', 'none', '']:
+        return 0.0
+    if binary:
+        return 1.0 if severity_norm == 'yes' else 0.0
+    return severity_weight(len(dsm_codes), SEVERITY_ADJUSTMENT.get(severity_norm, 0.0))
+
+
+def severity_weight(n_codes, adjustment, base_weight=BASE_WEIGHT, reduction=WEIGHT_REDUCTION,
+                    min_weight=MIN_WEIGHT):
+    """Weight of a present answer with severity ``adjustment`` to a question with ``n_codes`` DSM codes."""
+    weight = max(min_weight, base_weight - reduction * (n_codes - 1))
+    return round(weight * adjustment, 2)
+
+
+def rule_threshold(n_symptoms, symptom_threshold=SYMPTOM_THRESHOLD):
+    """Symptoms a rule needs present; present_count must also be > 0, so never below one."""
+    return max(1, math.ceil(n_symptoms * symptom_threshold))
+
+
+def severity_code(severity):
+    return SEVERITY_CODES.get(severity.lower(), SEVERITY_OTHER)
+
+
+# Weight for every (number of DSM codes, severity code, binary) combination a
+# question bank can produce. Built once from calculate_question_weight, which
+# stays the reference definition.
+MAX_TABLE_DSM_CODES = 8
+WEIGHT_TABLE = {
+    (n, code, binary): calculate_question_weight([None] * n, SEVERITY_NAMES[code], binary)
+    for n in range(MAX_TABLE_DSM_CODES + 1)
+    for code in range(len(SEVERITY_NAMES))
+    for binary in (False, True)
+}
+
+
+def question_weight(n_codes, code, binary=False):
+    weight = WEIGHT_TABLE.get((n_codes, code, binary))
+    if weight is None:
+        weight = calculate_question_weight([None] * n_codes, SEVERITY_NAMES[code], binary)
+    return weight
+
+
+def record_answer(q, severity):
+    """Build the answers entry for a question answered with ``severity``.
+
+    ``severity`` is the submitted string or an already-encoded severity code.
+    """
+    code = severity if isinstance(severity, int) else severity_code(severity)
+    codes = q.get('dsm_codes', [])
+    return {
+        'value': 'no' if code == SEVERITY_NONE else 'yes',
+        'severity': code,
+        'question_weight': question_weight(len(codes), code),
+        'dsm_codes': codes,
+        'was_skipped': False
+    }
+
+
+def skipped_answer(q):
+    return {
+        'value': 'no',
+        'severity': SEVERITY_NONE,
+        'question_weight': 0.0,
+        'dsm_codes': q.get('dsm_codes', []),
+        'was_skipped': True
+    }
+
+
+def needs_to_skip(q, answers):
+    if "dependency" in q:
+        return answers.get(q["dependency"], {}).get('value', "no") != "yes"
+    if "dependencies" in q:
+        return not any(answers.get(dep, {}).get('value', "no") == "yes" for dep in q["dependencies"])
+    return False
+
+
+def validate_answer(symptom: str, answer: str, answers: dict, validation_rules: list) -> bool:
+    if answer.lower() == 'no':
+        return True
+    for rule in validation_rules:
+        if symptom in rule['symptoms'] and rule['condition'] == 'not_simultaneous':
+            if any(answers.get(other, {}).get('value', 'no') == 'yes'
+                   for other in rule['symptoms'] if other != symptom):
+                return False
+    return True
+
+
+def validation_message(symptom, validation_rules):
+    return next(
+        rule['message']
+        for rule in validation_rules
+        if symptom in rule['symptoms']
+    )
+
+
+def replay_answers(questions, severities, validation_rules):
+    """Walk the questions in order as the interactive flow would.
+
+    ``severities`` maps symptom to the submitted severity; unanswered questions
+    count as "No". Raises ValueError with the validation message when the
+    answer set breaks a validation rule.
+    """
+    answers = {}
+    for q in questions:
+        if needs_to_skip(q, answers):
+            answers[q['symptom']] = skipped_answer(q)
+            continue
+        entry = record_answer(q, severities.get(q['symptom'], 'No'))
+        if not validate_answer(q['symptom'], entry['value'], answers, validation_rules):
+            raise ValueError(validation_message(q['symptom'], validation_rules))
+        answers[q['symptom']] = entry
+    return answers
+
+
+class QuestionGraph:
+    """Immutable dependency graph over the question bank.
+
+    Questions get integer ids by position. ``dependency``/``dependencies`` are
+    resolved once into adjacency lists and bitmasks, and the file order is
+    checked to be a topological order, so navigation only needs two answer
+    bitmasks: ``answered`` (answered and not skipped) and ``yes``.
+    """
+
+    def __init__(self, questions):
+        self.symptoms = tuple(q['symptom'] for q in questions)
+        self.ids = {symptom: i for i, symptom in enumerate(self.symptoms)}
+        dependencies = []
+        dependents = [[] for _ in questions]
+        for i, q in enumerate(questions):
+            if "dependency" in q:
+                names = [q["dependency"]]
+            else:
+                names = q.get("dependencies", [])
+            deps = []
+            for name in names:
+                dep = self.ids.get(name)
+                if dep is None or dep >= i:
+                    raise ValueError(f"Question '{q['symptom']}' depends on '{name}', "
+                                     f"which is not asked before it")
+                deps.append(dep)
+                dependents[dep].append(i)
+            dependencies.append(tuple(deps))
+        self.dependencies = tuple(dependencies)
+        self.dependents = tuple(tuple(d) for d in dependents)
+        self.dependency_masks = tuple(_mask(deps) for deps in self.dependencies)
+
+    def __len__(self):
+        return len(self.symptoms)
+
+    def masks(self, answers):
+        """Build the (answered, yes) bitmasks from an answers dict."""
+        answered = yes = 0
+        for symptom, ans in answers.items():
+            i = self.ids.get(symptom)
+            if i is None:
+                continue
+            if not ans.get('was_skipped', False):
+                answered |= 1 << i
+            if ans.get('value', 'no') == 'yes':
+                yes |= 1 << i
+        return answered, yes
+
+    def is_skipped(self, i, yes):
+        mask = self.dependency_masks[i]
+        return mask != 0 and not mask & yes
+
+    def next_question(self, idx, answered, yes):
+        """Find the first question at or after ``idx`` that is not skipped.
+
+        Returns ``(index, skipped, answered, yes)`` where ``skipped`` lists the
+        ids passed over and the masks are updated for them. ``index`` equals
+        ``len(self)`` when the assessment is complete.
+        """
+        skipped = []
+        n = len(self.symptoms)
+        while idx < n and self.is_skipped(idx, yes):
+            bit = ~(1 << idx)
+            answered &= bit
+            yes &= bit
+            skipped.append(idx)
+            idx += 1
+        return idx, skipped, answered, yes
+
+    def previous_answered(self, idx, answered):
+        """Index of the last answered question before ``idx``, or -1."""
+        return (answered & ((1 << idx) - 1)).bit_length() - 1
+
+    def record(self, i, value, answered, yes):
+        bit = 1 << i
+        answered |= bit
+        yes = yes | bit if value == 'yes' else yes & ~bit
+        return answered, yes
+
+
+TALLY_SCALE = 10000
+
+
+def _present_weight(ans):
+    """The weight an answer adds to a rule, 0.0 when it does not count as present."""
+    if not ans or ans.get('value', 'no') != 'yes':
+        return 0.0
+    weight = ans.get('question_weight', 0)
+    return weight if weight > 0 else 0.0
+
+
+def _scaled(weight):
+    return round(weight * TALLY_SCALE)
+
+
+class CompiledRules:
+    """Diagnosis rules compiled into bitmasks over a fixed symptom column order.
+
+    Every symptom referenced by a rule gets a column. Each rule keeps a mask of
+    its plain symptoms, one mask per ``any_of`` group and its precomputed 70%
+    threshold, so scoring a set of answers is a few integer mask operations per
+    rule. Weights are summed in the rule's own symptom order to stay
+    bit-for-bit identical with the original loop.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.columns = {}
+        self.names = []
+        self.dsm_codes = []
+        self.plain_masks = []
+        self.group_masks = []
+        self.slots = []
+        self.any_of = []
+        self.thresholds = []
+
+        for rule in rules:
+            plain_mask = 0
+            groups = []
+            slots = []
+            any_of = []
+            for sym in rule["symptoms"]:
+                if isinstance(sym, dict) and "any_of" in sym:
+                    cols = tuple(self._column(s) for s in sym["any_of"])
+                    groups.append(_mask(cols))
+                    any_of.append(True)
+                else:
+                    cols = (self._column(sym),)
+                    plain_mask |= _mask(cols)
+                    any_of.append(False)
+                slots.append(cols)
+            self.names.append(rule["name"])
+            self.dsm_codes.append(rule["dsm_code"])
+            self.plain_masks.append(plain_mask)
+            self.group_masks.append(tuple(groups))
+            self.slots.append(tuple(slots))
+            self.any_of.append(tuple(any_of))
+            self.thresholds.append(rule_threshold(len(slots)))
+
+        self.size = len(self.columns)
+        self.column_names = list(self.columns)
+        # For each column, the (rule, slot, group) positions it feeds; group is
+        # the index into a tally's "groups" list for any_of slots, else None.
+        self.column_slots = [[] for _ in range(self.size)]
+        self.group_count = 0
+        for r, slots in enumerate(self.slots):
+            for s, cols in enumerate(slots):
+                group = None
+                if self.any_of[r][s]:
+                    group = self.group_count
+                    self.group_count += 1
+                for col in cols:
+                    self.column_slots[col].append((r, s, group))
+
+    def _column(self, symptom):
+        return self.columns.setdefault(symptom, len(self.columns))
+
+    def vectorize(self, answers):
+        """Turn an answers dict into (present bitmask, per-column weights)."""
+        present = 0
+        weights = [0.0] * self.size
+        columns = self.columns
+        for symptom, ans in answers.items():
+            col = columns.get(symptom)
+            if col is None:
+                continue
+            weight = ans.get('question_weight', 0)
+            if ans.get('value', 'no') == 'yes' and weight > 0:
+                present |= 1 << col
+                weights[col] = weight
+        return present, weights
+
+    def score_rule(self, i, present, weights):
+        """Average weight of rule ``i``'s satisfied slots, or None below its symptom threshold."""
+        count = (present & self.plain_masks[i]).bit_count()
+        for group in self.group_masks[i]:
+            if present & group:
+                count += 1
+        if count < self.thresholds[i]:
+            return None
+        total_weight = 0.0
+        for cols in self.slots[i]:
+            for col in cols:
+                if present >> col & 1:
+                    total_weight += weights[col]
+                    break
+        return total_weight / count
+
+    def score(self, present, weights):
+        diagnoses = []
+        for i in range(len(self.slots)):
+            certainty = self.score_rule(i, present, weights)
+            if certainty is None:
+                continue
+            diagnoses.append({
+                "name": self.names[i],
+                "dsm_code": self.dsm_codes[i],
+                "question_weight": certainty
+            })
+        return diagnoses
+
+    def tally(self, answers):
+        """Running per-rule totals for an answers dict, kept up to date by ``update_tally``.
+
+        ``counts`` are satisfied slots per rule, ``weights`` the summed slot
+        weights in units of 1/TALLY_SCALE (weights have two decimals, so the
+        integers are exact) and ``groups`` the present members of each any_of
+        slot.
+        """
+        tally = {"counts": [0] * len(self.slots), "weights": [0] * len(self.slots), "groups": [0] * self.group_count}
+        # Replay the answers one at a time so any_of slots see a consistent prefix.
+        seen = {}
+        for symptom, ans in answers.items():
+            seen[symptom] = ans
+            self.update_tally(tally, seen, symptom, None)
+        return tally
+
+    def update_tally(self, tally, answers, symptom, old):
+        """Adjust ``tally`` after ``answers[symptom]`` changed from ``old``.
+
+        ``answers`` is the dict after the change; ``old`` is None for a new
+        answer and the removed entry when undoing one. Only the slots fed by
+        ``symptom`` are touched.
+        """
+        col = self.columns.get(symptom)
+        if col is None:
+            return tally
+        was, now = _present_weight(old), _present_weight(answers.get(symptom))
+        if was == now:
+            return tally
+        counts, weights, groups = tally["counts"], tally["weights"], tally["groups"]
+        for r, s, group in self.column_slots[col]:
+            if group is None:
+                counts[r] += (now > 0) - (was > 0)
+                weights[r] += _scaled(now) - _scaled(was)
+                continue
+            cols = self.slots[r][s]
+            before = self._slot_weight(cols, answers, col, was)
+            groups[group] += (now > 0) - (was > 0)
+            after = self._slot_weight(cols, answers, col, now)
+            counts[r] += (after > 0) - (before > 0)
+            weights[r] += _scaled(after) - _scaled(before)
+        return tally
+
+    def _slot_weight(self, cols, answers, changed, weight):
+        """Weight of an any_of slot: its first present member, with ``changed`` set to ``weight``."""
+        for col in cols:
+            w = weight if col == changed else _present_weight(answers.get(self.column_names[col]))
+            if w > 0:
+                return w
+        return 0.0
+
+    def preview(self, tally):
+        """Progress per rule from a tally, without looking at the answers."""
+        return [
+            {
+                "name": self.names[r],
+                "dsm_code": self.dsm_codes[r],
+                "present": count,
+                "required": self.thresholds[r],
+                "question_weight": tally["weights"][r] / TALLY_SCALE / count if count else 0.0,
+            }
+            for r, count in enumerate(tally["counts"])
+        ]
+
+    def diagnose_tally(self, tally, answers):
+        """Same result as ``diagnose(answers)``, reading counts from an up-to-date tally.
+
+        Only rules over their threshold are summed again, in rule order, so the
+        reported certainty is bit-for-bit the one ``diagnose`` computes.
+        """
+        diagnoses = []
+        for r, count in enumerate(tally["counts"]):
+            if count < self.thresholds[r]:
+                continue
+            total_weight = 0.0
+            for cols in self.slots[r]:
+                for col in cols:
+                    w = _present_weight(answers.get(self.column_names[col]))
+                    if w > 0:
+                        total_weight += w
+                        break
+            diagnoses.append({
+                "name": self.names[r],
+                "dsm_code": self.dsm_codes[r],
+                "question_weight": total_weight / count
+            })
+        return sorted(
+            [d for d in diagnoses if d['question_weight'] * 100 >= CERTAINTY_THRESHOLD],
+            key=lambda x: x['question_weight'],
+            reverse=True
+        )
+
+    def diagnose(self, answers):
+        """Return the reportable diagnoses for an answers dict, most certain first."""
+        diagnoses = self.score(*self.vectorize(answers))
+        return sorted(
+            [d for d in diagnoses if d['question_weight'] * 100 >= CERTAINTY_THRESHOLD],
+            key=lambda x: x['question_weight'],
+            reverse=True
+        )
+
+
+# Margin (in percentage points) kept around CERTAINTY_THRESHOLD so float rounding
+# in the final average can never contradict a decision made from bounds.
+_CERTAINTY_MARGIN = 1e-6
+_ABSENT, _PRESENT, _OPEN = range(3)
+
+
+class AdaptivePlanner:
+    """Picks the next question for adaptive assessments.
+
+    After each answer every rule is bounded over all ways the unanswered
+    questions could still be answered: a rule is decided once its threshold
+    can no longer be reached, or once it is met and its certainty is known to
+    stay on one side of CERTAINTY_THRESHOLD. Questions that only feed decided
+    rules are dropped, so the reported diagnoses match a full walk; the
+    certainty shown is computed from the questions actually asked. The
+    remaining questions are asked in order of how many rules each answer is
+    expected to decide.
+    """
+
+    def __init__(self, questions, graph, rules):
+        self.graph = graph
+        self.rules = rules
+        self.column_questions = [None] * rules.size
+        for symptom, col in rules.columns.items():
+            self.column_questions[col] = graph.ids.get(symptom)
+        self.question_columns = {q: col for col, q in enumerate(self.column_questions) if q is not None}
+
+        self.question_rules = [[] for _ in questions]
+        for r, slots in enumerate(rules.slots):
+            for cols in slots:
+                for col in cols:
+                    q = self.column_questions[col]
+                    if q is not None and r not in self.question_rules[q]:
+                        self.question_rules[q].append(r)
+
+        # (lowest, highest) weight a present answer can carry; None when no
+        # answer offered for the question makes it count towards a rule.
+        self.weight_ranges = []
+        for q in questions:
+            codes = (SEVERITY_YES,) if q.get("binary", False) else (SEVERITY_MILD, SEVERITY_MODERATE, SEVERITY_SEVERE)
+            weights = [question_weight(len(q.get("dsm_codes", [])), code) for code in codes]
+            weights = [w for w in weights if w > 0]
+            self.weight_ranges.append((min(weights), max(weights)) if weights else None)
+        self._first = None
+
+    def open_questions(self, answers):
+        """Ids of unanswered questions that can still be reached."""
+        _, yes = self.graph.masks(answers)
+        reachable = 0
+        for i, symptom in enumerate(self.graph.symptoms):
+            if symptom in answers:
+                continue
+            mask = self.graph.dependency_masks[i]
+            if mask == 0 or mask & (yes | reachable):
+                reachable |= 1 << i
+        return reachable
+
+    def column_status(self, answers, reachable):
+        present, weights = self.rules.vectorize(answers)
+        status = []
+        for col, q in enumerate(self.column_questions):
+            if present >> col & 1:
+                status.append((_PRESENT, weights[col], weights[col]))
+            elif q is not None and reachable >> q & 1 and self.weight_ranges[q] is not None:
+                status.append((_OPEN, *self.weight_ranges[q]))
+            else:
+                status.append((_ABSENT, 0.0, 0.0))
+        return status
+
+    def decide(self, r, status):
+        """True/False once rule ``r`` is certain to be reported or not, else None."""
+        fixed_lo = fixed_hi = 0.0
+        count = 0
+        optional = []
+        for cols in self.rules.slots[r]:
+            lo = hi = None
+            present = False
+            # The slot's weight comes from its first present symptom, so open
+            # symptoms before a present one can still change it.
+            for col in cols:
+                state, w_lo, w_hi = status[col]
+                if state == _ABSENT:
+                    continue
+                lo = w_lo if lo is None else min(lo, w_lo)
+                hi = w_hi if hi is None else max(hi, w_hi)
+                if state == _PRESENT:
+                    present = True
+                    break
+            if present:
+                count += 1
+                fixed_lo += lo
+                fixed_hi += hi
+            elif lo is not None:
+                optional.append((lo, hi))
+
+        need = max(0, self.rules.thresholds[r] - count)
+        if need > len(optional):
+            return False
+        lows = sorted(lo for lo, _ in optional)
+        highs = sorted((hi for _, hi in optional), reverse=True)
+        min_avg = max_avg = None
+        total_lo, total_hi = fixed_lo + sum(lows[:need]), fixed_hi + sum(highs[:need])
+        for k in range(need, len(optional) + 1):
+            if k > need:
+                total_lo += lows[k - 1]
+                total_hi += highs[k - 1]
+            n = count + k
+            avg_lo, avg_hi = total_lo / n, total_hi / n
+            min_avg = avg_lo if min_avg is None else min(min_avg, avg_lo)
+            max_avg = avg_hi if max_avg is None else max(max_avg, avg_hi)
+        if max_avg * 100 < CERTAINTY_THRESHOLD - _CERTAINTY_MARGIN:
+            return False
+        if need == 0 and min_avg * 100 >= CERTAINTY_THRESHOLD + _CERTAINTY_MARGIN:
+            return True
+        return None
+
+    def next_question(self, answers):
+        """Return ``(question id or None, questions still relevant)`` for an answers dict."""
+        if not answers:
+            # Every assessment starts from the same empty state.
+            if self._first is None:
+                self._first = self._plan(answers)
+            return self._first
+        return self._plan(answers)
+
+    def _plan(self, answers):
+        reachable = self.open_questions(answers)
+        status = self.column_status(answers, reachable)
+        undecided = {r for r in range(len(self.rules.slots)) if self.decide(r, status) is None}
+
+        relevant = 0
+        for r in undecided:
+            for cols in self.rules.slots[r]:
+                for col in cols:
+                    if status[col][0] == _OPEN:
+                        relevant |= 1 << self.column_questions[col]
+        # Unanswered dependencies of a relevant question have to be asked first.
+        _, yes = self.graph.masks(answers)
+        for i in range(len(self.graph) - 1, -1, -1):
+            if relevant >> i & 1 and not self.graph.dependency_masks[i] & yes:
+                relevant |= self.graph.dependency_masks[i] & reachable
+        if not relevant:
+            return None, 0
+
+        best = best_key = None
+        for i in range(len(self.graph)):
+            if not relevant >> i & 1:
+                continue
+            mask = self.graph.dependency_masks[i]
+            if mask and not mask & yes:
+                continue
+            key = (self.expected_decisions(i, undecided, status), -i)
+            if best_key is None or key > best_key:
+                best, best_key = i, key
+        return best, relevant.bit_count()
+
+    def expected_decisions(self, q, undecided, status):
+        """Rules an answer to ``q`` is expected to decide, counting present/absent as equally likely."""
+        col = self.question_columns.get(q)
+        if col is None or status[col][0] != _OPEN:
+            return 0.0
+        rules = [r for r in self.question_rules[q] if r in undecided]
+        current = status[col]
+        _, lo, hi = current
+        decided = 0.0
+        for outcome, share in (((_ABSENT, 0.0, 0.0), 0.5), ((_PRESENT, lo, lo), 0.25), ((_PRESENT, hi, hi), 0.25)):
+            status[col] = outcome
+            decided += share * sum(self.decide(r, status) is not None for r in rules)
+        status[col] = current
+        return decided
+
+
+def _mask(columns):
+    mask = 0
+    for col in columns:
+        mask |= 1 << col
+    return mask
+
@@ -0,0 +1,259 @@
+"""Non-blocking pipeline for assessment events (answers, skips, diagnoses).
+
+Request threads only append ``(kind, time, fields)`` to a bounded queue; a
+background thread turns them into JSON and writes them in batches to the
+configured sink:
+
+- ``log``: one ``logging`` line per event (default)
+- ``jsonl``: ``EVENTS_PATH`` (default ``events.jsonl``), rotated at ``EVENTS_MAX_BYTES``
+- ``sqlite``: an ``events`` table in ``EVENTS_PATH`` (default ``events.sqlite3``)
+- ``off``: events are discarded
+
+Backpressure: when the queue is full the new event is dropped rather than
+blocking the request, and the writer reports how many were lost. Pipelines
+that must not lose events (the result store) wait ``put_timeout`` for room
+and retry failed writes instead. Sampling
+(``EVENTS_SAMPLE="answer=0.1,skip=0"``) happens before anything is queued.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+EVENTS_SINK = os.environ.get('EVENTS_SINK', 'log')
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 10000))
+EVENTS_BATCH_SIZE = int(os.environ.get('EVENTS_BATCH_SIZE', 500))
+EVENTS_FLUSH_INTERVAL = float(os.environ.get('EVENTS_FLUSH_INTERVAL', 0.5))
+EVENTS_MAX_BYTES = int(os.environ.get('EVENTS_MAX_BYTES', 10 * 1024 * 1024))
+EVENTS_BACKUPS = int(os.environ.get('EVENTS_BACKUPS', 5))
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        kind, _, rate = item.partition('=')
+        rates[kind.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(os.environ.get('EVENTS_SAMPLE', ''))
+
+
+def format_event(kind, ts, fields):
+    if kind == 'answer':
+        return f"Recorded answer for '{fields['symptom']}': {fields['answer']}"
+    if kind == 'skip':
+        return f"Skipping question '{fields['symptom']}' due to unmet dependencies."
+    if kind == 'start':
+        return "Starting new assessment."
+    if kind == 'diagnosis':
+        return f"Final diagnoses: {fields['diagnoses']}"
+    return f"{kind}: {fields}"
+
+
+class LogSink:
+    def write(self, batch):
+        for kind, ts, fields in batch:
+            logging.info(format_event(kind, ts, fields))
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """Appends one JSON object per line, rotating to ``path.1`` .. ``path.N`` by size.
+
+    Put ``{pid}`` in the path to give each worker process its own file.
+    """
+
+    def __init__(self, path, max_bytes=EVENTS_MAX_BYTES, backups=EVENTS_BACKUPS):
+        self.path = path.format(pid=os.getpid())
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.f = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, batch):
+        self.f.write(''.join(
+            json.dumps({"ts": ts, "event": kind, **fields}, default=str) + '\n'
+            for kind, ts, fields in batch
+        ))
+        self.f.flush()
+        if self.max_bytes and self.f.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.f.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.f = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.f.close()
+
+
+class SqliteSink:
+    """One row per event; safe to share between worker processes."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY, ts REAL NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL)'
+        )
+        self.db.commit()
+
+    def write(self, batch):
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO events (ts, event, data) VALUES (?, ?, ?)',
+                [(ts, kind, json.dumps(fields, default=str)) for kind, ts, fields in batch]
+            )
+
+    def close(self):
+        self.db.close()
+
+
+SINKS = ('log', 'jsonl', 'sqlite', 'off')
+if EVENTS_SINK not in SINKS:
+    raise ValueError(f"Unknown EVENTS_SINK {EVENTS_SINK!r}; expected one of {', '.join(SINKS)}")
+
+
+def open_sink(name=EVENTS_SINK):
+    if name == 'jsonl':
+        return JsonlSink(os.environ.get('EVENTS_PATH', 'events.jsonl'))
+    if name == 'sqlite':
+        return SqliteSink(os.environ.get('EVENTS_PATH', 'events.sqlite3'))
+    return LogSink()
+
+
+class EventPipeline:
+    """Bounded queue drained in batches by a writer thread.
+
+    ``open_sink`` is called on the writer thread and returns the object whose
+    ``write(batch)`` receives the events; ``None`` disables the pipeline.
+
+    With ``put_timeout`` set, ``emit`` waits that long for room in the queue
+    before giving up, and a failed ``write`` is retried ``retries`` times with
+    doubling delays. Events given up on either way are passed to
+    ``on_lost(reason, count)``.
+    """
+
+    def __init__(self, open_sink, maxsize=EVENTS_QUEUE_SIZE, batch_size=EVENTS_BATCH_SIZE,
+                 flush_interval=EVENTS_FLUSH_INTERVAL, sample_rates=None, put_timeout=None,
+                 retries=0, retry_delay=0.1, on_lost=None):
+        self.open_sink = open_sink
+        self.enabled = open_sink is not None
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rates = sample_rates or {}
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_lost = on_lost
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = self._thread = None
+
+    def emit(self, kind, **fields):
+        """Queue an event; formatting happens on the writer thread.
+
+        Never blocks unless the pipeline was created with ``put_timeout``.
+        """
+        if not self.enabled:
+            return
+        rate = self.sample_rates.get(kind, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            if self.put_timeout is None:
+                self._queue.put_nowait((kind, time.time(), fields))
+            else:
+                self._queue.put((kind, time.time(), fields), timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            self._lost('queue_full', 1)
+
+    def _lost(self, reason, count):
+        if self.on_lost is not None:
+            try:
+                self.on_lost(reason, count)
+            except Exception as e:
+                logging.error(f"Could not count {count} lost events: {e}")
+
+    def _start(self):
+        # Threads do not survive a fork, so each worker process starts its own.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.maxsize)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                            name='events-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, q):
+        sink = self.open_sink()
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                event = q.get(timeout=self.flush_interval)
+                while event is not None:
+                    batch.append(event)
+                    if len(batch) >= self.batch_size:
+                        break
+                    event = q.get_nowait()
+                else:
+                    stopping = True
+            except queue.Empty:
+                pass
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                logging.warning(f"Event queue full; dropped {dropped} events.")
+            if batch:
+                self._write(sink, batch)
+        sink.close()
+
+    def _write(self, sink, batch):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                sink.write(batch)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    logging.error(f"Could not write {len(batch)} events: {e}")
+                    self._lost('write_failed', len(batch))
+                    return
+                logging.warning(f"Could not write {len(batch)} events, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay *= 2
+
+    def close(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+pipeline = EventPipeline(None if EVENTS_SINK == 'off' else open_sink, sample_rates=SAMPLE_RATES)
+emit = pipeline.emit
+atexit.register(pipeline.close)
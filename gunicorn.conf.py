@@ -0,0 +1,19 @@
+import gc
+import os
+
+# Import the app, and with it Flask and the compiled question bank, once in
+# the master. Workers are forked from it and start serving straight away
+# instead of each repeating the imports. Set GUNICORN_PRELOAD=0 to have every
+# worker import the app itself (for example to pick up code changes on HUP).
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app
+    app.warm_up()
+    # Everything loaded so far lives as long as the process. Freezing it keeps
+    # the workers' garbage collector from writing to (and so copying) the
+    # pages they share with the master.
+    gc.freeze()
@@ -0,0 +1,112 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from bank import CACHE_DIR, BankRegistry
+
+INSTRUMENTS_DIR = os.environ.get('INSTRUMENTS_DIR', 'instruments')
+# Name the root questions.json/rules.json bank is also served under, at /i/<name>/.
+DEFAULT_INSTRUMENT = os.environ.get('DEFAULT_INSTRUMENT', 'dsm5')
+# Instruments nobody has used for this long are dropped from memory.
+IDLE_SECONDS = float(os.environ.get('INSTRUMENT_IDLE_SECONDS', 900))
+
+_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+
+class InstrumentRegistry:
+    """Named question banks served side by side, each with its own BankRegistry.
+
+    The default instrument is the root bank and always stays loaded. Every
+    other instrument lives in ``<instruments_dir>/<name>/`` with its own
+    questions.json and rules.json; it is loaded on first use and dropped
+    again after ``idle_seconds`` without requests. Sessions pinned to a
+    dropped instrument load it back, from the compiled-bank cache on disk.
+    Structures two instruments compile identically are shared between them
+    (see ``bank.share_components``).
+
+    ``current()`` and ``get()`` serve the default instrument, so this can be
+    used wherever a BankRegistry is expected.
+    """
+
+    def __init__(self, default, instruments_dir=INSTRUMENTS_DIR, default_name=DEFAULT_INSTRUMENT,
+                 idle_seconds=IDLE_SECONDS, cache_dir=CACHE_DIR, check_interval=2.0):
+        self.default = default
+        self.default_name = default_name
+        self.instruments_dir = instruments_dir
+        self.idle_seconds = idle_seconds
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._loaded = {}
+        self._last_used = {}
+        self._swept = time.monotonic()
+
+    def paths(self, name):
+        """(questions_path, rules_path) for ``name``, or None if there is no such instrument."""
+        if not _NAME.fullmatch(name) or not self.instruments_dir:
+            return None
+        directory = os.path.join(self.instruments_dir, name)
+        paths = (os.path.join(directory, 'questions.json'), os.path.join(directory, 'rules.json'))
+        return paths if all(os.path.isfile(p) for p in paths) else None
+
+    def names(self):
+        names = {self.default_name}
+        try:
+            entries = os.listdir(self.instruments_dir) if self.instruments_dir else []
+        except OSError:
+            entries = []
+        names.update(name for name in entries if self.paths(name) is not None)
+        return sorted(names)
+
+    def registry(self, name=None):
+        """The BankRegistry for instrument ``name``, loading it if needed; None if unknown."""
+        if name is None or name == self.default_name:
+            return self.default
+        now = time.monotonic()
+        registry = self._loaded.get(name)
+        if registry is None:
+            with self._lock:
+                registry = self._loaded.get(name)
+                if registry is None:
+                    paths = self.paths(name)
+                    if paths is None:
+                        return None
+                    registry = BankRegistry(*paths, cache_dir=self.cache_dir,
+                                            check_interval=self.check_interval)
+                    self._loaded[name] = registry
+                    self._last_used[name] = now
+                    logging.info(f"Instrument {name} loaded (version {registry.current().version}).")
+        self._last_used[name] = now
+        return registry
+
+    def sweep(self, now=None):
+        """Run ``evict_idle`` if it has not run recently; cheap enough for every request."""
+        now = time.monotonic() if now is None else now
+        if now - self._swept >= min(self.idle_seconds, 60.0):
+            return self.evict_idle(now)
+        return []
+
+    def evict_idle(self, now=None):
+        """Drop instruments idle for longer than ``idle_seconds``; returns their names."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._swept = now
+            idle = [name for name in self._loaded
+                    if now - self._last_used.get(name, 0.0) > self.idle_seconds]
+            for name in idle:
+                del self._loaded[name]
+                self._last_used.pop(name, None)
+        for name in idle:
+            logging.info(f"Instrument {name} evicted after {self.idle_seconds:.0f}s idle.")
+        return idle
+
+    def loaded(self):
+        return [self.default_name] + sorted(self._loaded)
+
+    def current(self):
+        return self.default.current()
+
+    def get(self, version):
+        return self.default.get(version)
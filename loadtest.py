@@ -0,0 +1,467 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from bank import load_bank
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Client:
+    """Minimal keep-alive HTTP/1.1 client with a cookie jar, one per virtual user."""
+
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', content_type=None):
+        return await asyncio.wait_for(self._request(method, path, body, content_type), self.timeout)
+
+    async def _request(self, method, path, body, content_type):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}"]
+        if content_type:
+            lines.append(f"Content-Type: {content_type}")
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise HTTPError("connection closed")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, cookie_value = value.split(';', 1)[0].partition('=')
+                if cookie_value:
+                    self.cookies[cookie_name] = cookie_value
+                else:
+                    self.cookies.pop(cookie_name, None)
+            headers[name] = value
+
+        if headers.get('transfer-encoding') == 'chunked':
+            data = await self._read_chunked()
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, headers, data
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            chunk = await self.reader.readexactly(size + 2)
+            if size == 0:
+                return b''.join(chunks)
+            chunks.append(chunk[:-2])
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.events = {}
+
+    def record(self, step, seconds, ok):
+        self.latencies.setdefault(step, []).append(seconds)
+        if not ok:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+    def count(self, event, n=1):
+        """Tally something a virtual user ran into (completed walks, skips, validation errors)."""
+        self.events[event] = self.events.get(event, 0) + n
+
+    def merge(self, other):
+        for step, values in other.latencies.items():
+            self.latencies.setdefault(step, []).extend(values)
+        for step, n in other.errors.items():
+            self.errors[step] = self.errors.get(step, 0) + n
+        for event, n in other.events.items():
+            self.count(event, n)
+
+    def summary(self, elapsed):
+        all_latencies = sorted(x for values in self.latencies.values() for x in values)
+        total = len(all_latencies)
+        errors = sum(self.errors.values())
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "rps": total / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(all_latencies, 50) * 1000,
+            "p95_ms": percentile(all_latencies, 95) * 1000,
+            "p99_ms": percentile(all_latencies, 99) * 1000,
+            "steps": {
+                step: {
+                    "requests": len(values),
+                    "errors": self.errors.get(step, 0),
+                    "p50_ms": percentile(sorted(values), 50) * 1000,
+                    "p95_ms": percentile(sorted(values), 95) * 1000,
+                    "p99_ms": percentile(sorted(values), 99) * 1000,
+                }
+                for step, values in self.latencies.items()
+            },
+            "events": dict(self.events),
+        }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+async def timed(recorder, step, client, method, path, body=b'', content_type=None, expect=(200,)):
+    """Send one request and record its latency under ``step``, or under ``step(status, data)``."""
+    started = time.perf_counter()
+    try:
+        status, headers, data = await client.request(method, path, body, content_type)
+        ok = status in expect
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError, ValueError):
+        status, headers, data, ok = 0, {}, b'', False
+        await client.close()
+    if callable(step):
+        step = step(status, data)
+    recorder.record(step, time.perf_counter() - started, ok)
+    return status, data
+
+
+async def api_user(client, recorder, bank, rnd, behaviour):
+    """One walk through the JSON assessment API."""
+    await timed(recorder, "questions", client, "GET", "/api/questions")
+    reset = json.dumps({"answers": {}, "reset": True}).encode()
+    await timed(recorder, "answers", client, "POST", "/api/answers", reset, "application/json")
+    for q in bank.questions:
+        choices = ["None", "Yes"] if q.get("binary", False) else ["None", "Mild", "Moderate", "Severe"]
+        body = json.dumps({"answers": {q["symptom"]: rnd.choice(choices)}}).encode()
+        await timed(recorder, "answers", client, "POST", "/api/answers", body, "application/json")
+    await timed(recorder, "result", client, "GET", "/api/result", expect=(200, 400))
+
+
+QUESTION_RE = re.compile(rb"Question (\d+) of (\d+)")
+RESULT_MARKER = b"Diagnosis Result"
+ERROR_MARKER = b"<h2>Error</h2>"
+
+
+def page_step(status, data):
+    if RESULT_MARKER in data:
+        return "result"
+    if ERROR_MARKER in data and status == 200:
+        return "validation_error"
+    return "answer"
+
+
+def choose_severity(q, rnd, bank, behaviour, conflict):
+    """A browser user's answer, biased to exercise dependency skips and validation rules."""
+    binary = q.get("binary", False)
+    positive = "Yes" if binary else rnd.choice(["Mild", "Moderate", "Severe"])
+    if conflict and any(q["symptom"] in rule["symptoms"] for rule in bank.validation_rules):
+        return positive
+    if bank.graph.dependents[bank.graph.ids[q["symptom"]]]:
+        # Gate questions: "No" skips everything that depends on them.
+        return "No" if rnd.random() < behaviour["skip_rate"] else positive
+    return rnd.choice(["No", "Yes"] if binary else ["No", "Mild", "Moderate", "Severe"])
+
+
+async def form_user(client, recorder, bank, rnd, behaviour):
+    """One browser-style walk: /start, then /ask with the session cookie until the result page.
+
+    Mixes in back hops, answers that close dependency gates and, for a share
+    of walks, answers that break a not_simultaneous validation rule.
+    """
+    questions = bank.questions
+    status, _ = await timed(recorder, "start", client, "GET", "/start", expect=(302,))
+    if status != 302:
+        return
+    status, page = await timed(recorder, "question", client, "GET", "/ask")
+    conflict = rnd.random() < behaviour["conflict_rate"]
+    # Back hops revisit questions; the bound only stops a misbehaving server looping forever.
+    for _ in range(4 * len(questions)):
+        if status != 200:
+            return
+        if RESULT_MARKER in page:
+            recorder.count("completed")
+            return
+        if ERROR_MARKER in page:
+            # The answer was rejected; carry on with the next question as a user would.
+            recorder.count("validation_errors")
+            status, page = await timed(recorder, "question", client, "GET", "/ask")
+            continue
+        match = QUESTION_RE.search(page)
+        if match is None:
+            recorder.record("question", 0.0, False)
+            return
+        idx = int(match.group(1)) - 1
+        if idx > 0 and rnd.random() < behaviour["back_rate"]:
+            recorder.count("back_hops")
+            status, _ = await timed(recorder, "back", client, "GET", "/ask?direction=back", expect=(302,))
+            if status != 302:
+                return
+            status, page = await timed(recorder, "question", client, "GET", "/ask")
+            continue
+        body = f"severity={choose_severity(questions[idx], rnd, bank, behaviour, conflict)}".encode()
+        status, page = await timed(recorder, page_step, client, "POST", "/ask", body,
+                                   "application/x-www-form-urlencoded")
+        match = QUESTION_RE.search(page) if status == 200 else None
+        if match and int(match.group(1)) - 1 > idx + 1:
+            recorder.count("skipped_questions", int(match.group(1)) - 2 - idx)
+
+
+scenarios = {"api": api_user, "form": form_user}
+DEFAULT_BEHAVIOUR = {"back_rate": 0.05, "skip_rate": 0.5, "conflict_rate": 0.1}
+
+
+async def _run_users(base_url, scenario, concurrency, duration, seed, behaviour, first_user=0):
+    url = urlsplit(base_url)
+    bank = load_bank()
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    async def user(n):
+        rnd = random.Random(seed * 100003 + n)
+        client = Client(url.hostname, url.port or 80)
+        try:
+            while time.monotonic() < deadline:
+                await scenarios[scenario](client, recorder, bank, rnd, behaviour)
+        finally:
+            await client.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(user(first_user + n) for n in range(concurrency)))
+    return recorder, time.monotonic() - started
+
+
+async def run_load(base_url, scenario, concurrency, duration, seed=0, behaviour=None):
+    recorder, elapsed = await _run_users(base_url, scenario, concurrency, duration, seed,
+                                         behaviour or DEFAULT_BEHAVIOUR)
+    return recorder.summary(elapsed)
+
+
+def _process_users(args):
+    return asyncio.run(_run_users(*args))
+
+
+def run_load_processes(base_url, scenario, concurrency, duration, seed=0, behaviour=None, processes=1):
+    """Spread ``concurrency`` virtual users over ``processes`` client processes and merge their results.
+
+    One event loop saturates a core long before a multi-worker server does,
+    so heavier runs need several client processes.
+    """
+    if processes <= 1:
+        return asyncio.run(run_load(base_url, scenario, concurrency, duration, seed, behaviour))
+    shares = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    jobs = [(base_url, scenario, share, duration, seed, behaviour or DEFAULT_BEHAVIOUR, sum(shares[:i]))
+            for i, share in enumerate(shares) if share]
+    recorder = Recorder()
+    elapsed = 0.0
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        for part, seconds in pool.map(_process_users, jobs):
+            recorder.merge(part)
+            elapsed = max(elapsed, seconds)
+    return recorder.summary(elapsed)
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up")
+
+
+def server_commands(workers, port):
+    return {
+        "gunicorn": [sys.executable, "-m", "gunicorn", "-w", str(workers),
+                     "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+        "uvicorn": [sys.executable, "-m", "uvicorn", "--workers", str(workers),
+                    "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+                    "asgi:application"],
+        # Flask's threaded development server; ``workers`` does not apply.
+        "flask": [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port)],
+    }
+
+
+@contextlib.contextmanager
+def serving(server, workers, port):
+    """Run one of server_commands() for the duration of the block and yield its URL."""
+    # Load-test traffic must not end up in the real result store or event log.
+    env = dict(os.environ, RESULTS_PATH="", EVENTS_SINK="off")
+    env.setdefault("FLASK_SECRET_KEY", "loadtest-only-secret")
+    proc = subprocess.Popen(server_commands(workers, port)[server], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port("127.0.0.1", port)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def compare(args):
+    results = {}
+    for server, name in (("gunicorn", "gunicorn (sync)"), ("uvicorn", "uvicorn (asgi)")):
+        with serving(server, args.workers, args.port) as url:
+            results[name] = run_load_processes(url, args.scenario, args.concurrency, args.duration,
+                                               args.seed, behaviour(args), args.processes)
+    return results
+
+
+def saturation_curve(url, levels, args):
+    """One run per concurrency level: [(concurrency, summary), ...]."""
+    curve = []
+    for concurrency in levels:
+        summary = run_load_processes(url, args.scenario, concurrency, args.duration, args.seed,
+                                     behaviour(args), args.processes)
+        curve.append((concurrency, summary))
+    return curve
+
+
+def saturation_point(curve, slo_ms, max_error_rate):
+    """First concurrency level where the server falls over, and why; (None, None) if none did.
+
+    Falling over means breaking the p99 SLO or the error budget, or adding
+    users without gaining at least 5% throughput.
+    """
+    previous = None
+    for concurrency, summary in curve:
+        if summary["error_rate"] > max_error_rate:
+            return concurrency, f"error rate {summary['error_rate']:.1%}"
+        if summary["p99_ms"] > slo_ms:
+            return concurrency, f"p99 {summary['p99_ms']:.0f} ms over {slo_ms:.0f} ms"
+        if previous is not None and summary["rps"] < previous["rps"] * 1.05:
+            return concurrency, f"throughput flat at {summary['rps']:.0f} req/s"
+        previous = summary
+    return None, None
+
+
+def print_table(results):
+    print(f"{'server':<20} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, r in results.items():
+        print(f"{name:<20} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    for name, r in results.items():
+        print(f"\n{name}")
+        print(f"  {'step':<18} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for step, s in r["steps"].items():
+            print(f"  {step:<18} {s['requests']:>9} {s['errors']:>7} {s['p50_ms']:>8.1f} "
+                  f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+        if r["events"]:
+            print("  " + ", ".join(f"{event}: {n}" for event, n in sorted(r["events"].items())))
+
+
+def print_curve(curve, point, reason):
+    print(f"{'users':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for concurrency, r in curve:
+        print(f"{concurrency:>6} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['error_rate']:>7.1%}")
+    if point is None:
+        print("No saturation within the tested levels.")
+    else:
+        print(f"Saturated at {point} users: {reason}")
+
+
+def behaviour(args):
+    return {"back_rate": args.back_rate, "skip_rate": args.skip_rate, "conflict_rate": args.conflict_rate}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the assessment server.")
+    parser.add_argument("--url", help="Target an already running server")
+    parser.add_argument("--serve", choices=["gunicorn", "uvicorn", "flask"],
+                        help="Start this server with --workers workers and target it")
+    parser.add_argument("--compare", action="store_true",
+                        help="Start gunicorn (sync) and uvicorn (ASGI) in turn and compare them")
+    parser.add_argument("--scenario", choices=sorted(scenarios), default="api",
+                        help="api: the JSON API; form: the cookie-based /start -> /ask flow")
+    parser.add_argument("-c", "--concurrency", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="Client processes to spread the virtual users over")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("-w", "--workers", type=int, default=2,
+                        help="Server worker processes for --serve and --compare")
+    parser.add_argument("--port", type=int, default=8765, help="Port used by --serve and --compare")
+    parser.add_argument("--curve", help="Comma-separated concurrency levels for a saturation curve, "
+                                        "e.g. 5,10,20,50,100")
+    parser.add_argument("--slo-ms", type=float, default=500.0, help="p99 latency the curve must stay under")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate the curve tolerates")
+    parser.add_argument("--back-rate", type=float, default=DEFAULT_BEHAVIOUR["back_rate"],
+                        help="form: chance of a back hop before each answer")
+    parser.add_argument("--skip-rate", type=float, default=DEFAULT_BEHAVIOUR["skip_rate"],
+                        help="form: chance of answering No to a question others depend on")
+    parser.add_argument("--conflict-rate", type=float, default=DEFAULT_BEHAVIOUR["conflict_rate"],
+                        help="form: share of walks that break a validation rule")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        if args.curve:
+            parser.error("--curve needs --url or --serve")
+        results = compare(args)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_table(results)
+        return
+    if not (args.url or args.serve):
+        parser.error("pass --url, --serve or --compare")
+
+    with contextlib.ExitStack() as stack:
+        url = args.url or stack.enter_context(serving(args.serve, args.workers, args.port))
+        if args.curve:
+            levels = [int(n) for n in args.curve.split(",") if n]
+            curve = saturation_curve(url, levels, args)
+            point, reason = saturation_point(curve, args.slo_ms, args.max_error_rate)
+            if args.json:
+                print(json.dumps({"curve": [dict(summary, concurrency=c) for c, summary in curve],
+                                  "saturated_at": point, "reason": reason}, indent=2))
+            else:
+                print_curve(curve, point, reason)
+            return
+        results = {url: run_load_processes(url, args.scenario, args.concurrency, args.duration,
+                                           args.seed, behaviour(args), args.processes)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+# Where each worker process writes its series so /metrics can add them up
+# across gunicorn workers. Unset means this process only reports its own.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in the Prometheus layout."""
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        # label values -> [count per bucket (non-cumulative) ..., +Inf count, sum]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(labels): list(series) for labels, series in self._series.items()}
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key in sorted(series):
+            labels = dict(zip(self.labelnames, json.loads(key)))
+            counts = series[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with optional labels; merges across workers like a histogram."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        # label values -> [total]
+        self._series = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            series = self._series.setdefault(labels, [0])
+            series[0] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(labels): list(series) for labels, series in self._series.items()}
+
+    def render(self, series):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key in sorted(series):
+            labels = dict(zip(self.labelnames, json.loads(key)))
+            lines.append(f"{self.name}{_labels(labels)} {series[key][0]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + [(k, v) for k, v in extra.items()]
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+request_seconds = Histogram(
+    'kbes_request_duration_seconds', 'Request latency by route.', LATENCY_BUCKETS,
+    ('method', 'route', 'status')
+)
+diagnosis_seconds = Histogram(
+    'kbes_diagnosis_seconds', 'Time spent in generate_diagnosis.', LATENCY_BUCKETS
+)
+template_seconds = Histogram(
+    'kbes_template_render_seconds', 'Template render time.', LATENCY_BUCKETS, ('template',)
+)
+skip_iterations = Histogram(
+    'kbes_skip_iterations', 'Questions skipped for unmet dependencies per /ask request.', COUNT_BUCKETS
+)
+session_cookie_bytes = Histogram(
+    'kbes_session_cookie_bytes', 'Size of the session cookie set on a response.', SIZE_BUCKETS
+)
+results_lost = Counter(
+    'kbes_results_lost_total', 'Completed assessments that never reached the result store.', ('reason',)
+)
+collectors = [request_seconds, diagnosis_seconds, template_seconds, skip_iterations, session_cookie_bytes,
+              results_lost]
+
+
+def record_response(method, route, response, seconds, cookie_name):
+    request_seconds.observe(seconds, method, route, str(response.status_code))
+    for header in response.headers.getlist('Set-Cookie'):
+        if header.startswith(cookie_name + '='):
+            session_cookie_bytes.observe(len(header.split(';', 1)[0]) - len(cookie_name) - 1)
+    flush()
+
+
+# Files of exited workers are folded into this one, so totals never go backwards.
+CUMULATIVE_FILE = 'cumulative.json'
+_WORKER_FILE = re.compile(r'(?:worker-)?(\d+)(?:-[0-9a-f]+)?\.json')
+_token = None
+
+
+def process_token():
+    """pid plus a random suffix, new in every process, so a reused pid never reuses a file."""
+    global _token
+    pid = os.getpid()
+    if _token is None or _token[0] != pid:
+        _token = (pid, f"{pid}-{uuid.uuid4().hex[:12]}")
+    return _token[1]
+
+
+def metrics_path():
+    return os.path.join(METRICS_DIR, f"worker-{process_token()}.json")
+
+
+_last_flush = 0.0
+_pending = None
+
+
+def flush(force=False):
+    """Write this process's series to METRICS_DIR, at most once per FLUSH_INTERVAL.
+
+    Observations inside the interval are written by a deferred flush, so an
+    idle worker's last requests still show up on the next scrape.
+    """
+    global _last_flush, _pending
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        # Timers do not survive a fork, so one pending per process id.
+        if _pending is None or _pending[0] != os.getpid() or not _pending[1].is_alive():
+            timer = threading.Timer(FLUSH_INTERVAL, flush, (True,))
+            timer.daemon = True
+            timer.start()
+            _pending = (os.getpid(), timer)
+        return
+    _last_flush = now
+    data = {h.name: h.snapshot() for h in collectors}
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(data, metrics_path())
+    except OSError as e:
+        logging.warning(f"Could not write metrics: {e}")
+
+
+def _write_json(data, path):
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(merged, data):
+    for name, series in data.items():
+        target = merged.get(name)
+        if target is None:
+            continue
+        for key, counts in series.items():
+            current = target.get(key)
+            if current is None or len(current) != len(counts):
+                target[key] = list(counts)
+            else:
+                target[key] = [a + b for a, b in zip(current, counts)]
+
+
+def collect():
+    """All processes' series merged per collector: {name: {label key: counts}}.
+
+    Files of workers that have exited are added to CUMULATIVE_FILE and
+    removed. The cumulative file lists the files it has absorbed, so a fold
+    interrupted before the removal is not counted twice.
+    """
+    if not METRICS_DIR:
+        return {h.name: h.snapshot() for h in collectors}
+    # Multi-process collection is POSIX-only (gunicorn); importing here keeps
+    # the module importable on Windows for single-process runs.
+    import fcntl
+    flush(force=True)
+    merged = {h.name: {} for h in collectors}
+    cumulative_path = os.path.join(METRICS_DIR, CUMULATIVE_FILE)
+    # Scrapes in different workers fold and read under one lock.
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cumulative = _read_json(cumulative_path) or {"folded": [], "series": {}}
+        live = []
+        dead = []
+        for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+            name = os.path.basename(path)
+            match = _WORKER_FILE.fullmatch(name)
+            if match is None:
+                continue
+            if name in cumulative["folded"]:
+                dead.append(path)
+            elif _alive(int(match.group(1))):
+                live.append(path)
+            else:
+                data = _read_json(path)
+                if data is not None:
+                    folded = {h.name: {} for h in collectors}
+                    _merge(folded, cumulative["series"])
+                    _merge(folded, data)
+                    cumulative["series"] = folded
+                cumulative["folded"].append(name)
+                dead.append(path)
+        if dead:
+            try:
+                _write_json(cumulative, cumulative_path)
+                for path in dead:
+                    os.remove(path)
+                cumulative["folded"] = []
+                _write_json(cumulative, cumulative_path)
+            except OSError as e:
+                logging.warning(f"Could not fold metrics of exited workers: {e}")
+        _merge(merged, cumulative["series"])
+        for path in live:
+            data = _read_json(path)
+            if data is not None:
+                _merge(merged, data)
+    return merged
+
+
+def render():
+    merged = collect()
+    lines = []
+    for h in collectors:
+        lines.extend(h.render(merged[h.name]))
+    return '\n'.join(lines) + '\n'
+
+
+atexit.register(flush, True)
+
+
+# Opt-in profiler: a sampled fraction of requests runs under cProfile and the
+# ones slower than PROFILE_SLOW_MS are dumped as pstats files.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 250))
+
+
+def start_profile():
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is already active on this thread.
+        return None
+    return profile
+
+
+def finish_profile(profile, label, seconds):
+    if profile is None:
+        return
+    profile.disable()
+    if seconds * 1000 < PROFILE_SLOW_MS:
+        return
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label.strip('/').replace('/', '_') or 'root'}"
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{seconds * 1000:.0f}ms.pstats"))
+    except OSError as e:
+        logging.warning(f"Could not write profile: {e}")
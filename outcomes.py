@@ -0,0 +1,362 @@
+"""Precomputed diagnosis outcomes for every answer signature of a question bank.
+
+The full answer space is far too large to enumerate (four severities for
+most of the questions), but each diagnosis rule only reads its own symptoms.
+So the table is factored per rule: for every combination of the weights a
+rule's symptoms can carry, it stores the certainty the rule would report
+(or NOT_REPORTED). A diagnosis for any answer set is then one array read per
+rule, from a file that is memory-mapped rather than loaded.
+
+While building, every combination is also checked for reachability through
+the interactive flow (dependency skips and validation rules), and the
+reachable ones are used to report which questions never change each
+disorder's outcome.
+
+    python outcomes.py build -o outcomes.table
+    python outcomes.py report outcomes.table
+"""
+import argparse
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from bank import QUESTIONS_PATH, RULES_PATH, load_bank
+from engine import (CERTAINTY_THRESHOLD, SEVERITY_MILD, SEVERITY_MODERATE, SEVERITY_NONE, SEVERITY_SEVERE,
+                    SEVERITY_YES, _present_weight, question_weight)
+
+MAGIC = b'KBESOUT1'
+TABLE_PATH = 'outcomes.table'
+NOT_REPORTED = -1.0
+# Rules with more signatures than this are left out of the table and scored
+# directly on lookup.
+MAX_ENTRIES = 1 << 22
+
+
+def answer_codes(q):
+    """Severity codes the assessment offers for a question."""
+    if q.get('binary', False):
+        return (SEVERITY_NONE, SEVERITY_YES)
+    return (SEVERITY_NONE, SEVERITY_MILD, SEVERITY_MODERATE, SEVERITY_SEVERE)
+
+
+def column_states(bank, col):
+    """Weights a rule column can take, absent (0.0) first."""
+    q = bank.graph.ids.get(bank.rules.column_names[col])
+    states = [0.0]
+    if q is None:
+        return states
+    question = bank.questions[q]
+    for code in answer_codes(question):
+        weight = question_weight(len(question.get('dsm_codes', [])), code)
+        if weight > 0 and weight not in states:
+            states.append(weight)
+    return states
+
+
+def rule_columns(rules, r):
+    columns = []
+    for cols in rules.slots[r]:
+        columns.extend(col for col in cols if col not in columns)
+    return columns
+
+
+class Reachability:
+    """Whether some walk through the questions ends with exactly a given set present.
+
+    A present question must be reachable (one of its dependencies answered
+    Yes), absent ones may still be answered Yes where an offered answer has
+    no weight (binary questions), and validation rules forbid pairs of Yes
+    answers.
+    """
+
+    def __init__(self, bank):
+        self.graph = bank.graph
+        self.exclusive = [
+            {self.graph.ids[s] for s in rule['symptoms'] if s in self.graph.ids}
+            for rule in bank.validation_rules if rule['condition'] == 'not_simultaneous'
+        ]
+        # Questions that can be answered Yes without carrying weight.
+        self.weightless_yes = {
+            i for i, q in enumerate(bank.questions)
+            if any(code != SEVERITY_NONE and question_weight(len(q.get('dsm_codes', [])), code) <= 0
+                   for code in answer_codes(q))
+        }
+        self._cache = {}
+
+    def __call__(self, yes, no):
+        key = (yes, no)
+        if key not in self._cache:
+            self._cache[key] = self._satisfiable(set(yes), set(no))
+        return self._cache[key]
+
+    def _satisfiable(self, yes, no):
+        if yes & no or any(len(group & yes) > 1 for group in self.exclusive):
+            return False
+        for q in sorted(yes):
+            deps = self.graph.dependencies[q]
+            if deps and not yes.intersection(deps):
+                return any(self._satisfiable(yes | {d}, no) for d in deps if d not in no)
+        return True
+
+
+def build_rule(bank, r, reachable, max_entries=MAX_ENTRIES):
+    """Outcomes of rule ``r`` for every signature, plus which ones can occur."""
+    rules = bank.rules
+    columns = rule_columns(rules, r)
+    states = [column_states(bank, col) for col in columns]
+    entries = 1
+    for s in states:
+        entries *= len(s)
+    info = {
+        "name": rules.names[r],
+        "dsm_code": rules.dsm_codes[r],
+        "columns": [rules.column_names[col] for col in columns],
+        "states": states,
+        "entries": entries,
+    }
+    if entries > max_entries:
+        info["entries"] = 0
+        return info, None, None
+
+    strides = []
+    stride = 1
+    for s in reversed(states):
+        strides.append(stride)
+        stride *= len(s)
+    info["strides"] = strides[::-1]
+
+    question_ids = [bank.graph.ids.get(rules.column_names[col]) for col in columns]
+    values = array('d')
+    can_occur = bytearray()
+    weights = [0.0] * rules.size
+    for combo in itertools.product(*(range(len(s)) for s in states)):
+        present = 0
+        yes = []
+        no = []
+        for col, q, s, state in zip(columns, question_ids, states, combo):
+            weights[col] = s[state]
+            if state:
+                present |= 1 << col
+                yes.append(q)
+            elif q is not None and q not in reachable.weightless_yes:
+                no.append(q)
+        certainty = rules.score_rule(r, present, weights)
+        if certainty is None or certainty * 100 < CERTAINTY_THRESHOLD:
+            certainty = NOT_REPORTED
+        values.append(certainty)
+        can_occur.append(reachable(tuple(yes), tuple(no)))
+    return info, values, can_occur
+
+
+def redundancy(info, values, can_occur):
+    """Classify each symptom of a rule by how much it can change the outcome."""
+    strides, states = info["strides"], info["states"]
+    entries = len(values)
+    symptoms = {}
+    for symptom, stride, s in zip(info["columns"], strides, states):
+        radix = len(s)
+        decides = changes = False
+        if radix > 1:
+            for high in range(0, entries, stride * radix):
+                for base in range(high, high + stride):
+                    seen = [values[base + t * stride] for t in range(radix) if can_occur[base + t * stride]]
+                    if len(seen) < 2:
+                        continue
+                    if any(v != seen[0] for v in seen):
+                        changes = True
+                        if any((v == NOT_REPORTED) != (seen[0] == NOT_REPORTED) for v in seen):
+                            decides = True
+                            break
+                if decides:
+                    break
+        if radix == 1:
+            symptoms[symptom] = "never counts"
+        elif decides:
+            symptoms[symptom] = "decides"
+        elif changes:
+            symptoms[symptom] = "certainty only"
+        else:
+            symptoms[symptom] = "redundant"
+    return symptoms
+
+
+def build(bank, max_entries=MAX_ENTRIES):
+    """Return (header, per-rule value arrays) for ``bank``."""
+    reachable = Reachability(bank)
+    rules_info = []
+    tables = []
+    report = []
+    offset = 0
+    for r in range(len(bank.rules.slots)):
+        info, values, can_occur = build_rule(bank, r, reachable, max_entries)
+        info["offset"] = offset
+        rules_info.append(info)
+        entry = {"dsm_code": info["dsm_code"], "name": info["name"]}
+        if values is None:
+            entry["tabulated"] = False
+        else:
+            offset += len(values)
+            tables.append(values)
+            entry.update(
+                tabulated=True,
+                signatures=len(values),
+                reachable=sum(can_occur),
+                reported=sum(1 for v, ok in zip(values, can_occur) if ok and v != NOT_REPORTED),
+                symptoms=redundancy(info, values, can_occur),
+            )
+        entry["unused_questions"] = [
+            q['symptom'] for q in bank.questions
+            if info["dsm_code"] in q.get('dsm_codes', []) and q['symptom'] not in info["columns"]
+        ]
+        report.append(entry)
+    header = {
+        "bank_version": bank.version,
+        "byteorder": sys.byteorder,
+        "rules": rules_info,
+        "report": report,
+    }
+    return header, tables
+
+
+def write_table(path, header, tables):
+    blob = json.dumps(header, separators=(',', ':')).encode()
+    # Pad so the float64 values start 8-byte aligned.
+    blob += b' ' * (-(len(MAGIC) + 4 + len(blob)) % 8)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<I', len(blob)) + blob)
+            for values in tables:
+                values.tofile(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class OutcomeTable:
+    """Read-only, memory-mapped view of a table written by ``build``.
+
+    ``bank`` must be the version the table was built from; it is used to
+    score rules that were too large to tabulate and answers outside the
+    offered severities.
+    """
+
+    def __init__(self, path, bank):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an outcome table")
+        (size,) = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + size])
+        if self.header["bank_version"] != bank.version or self.header["byteorder"] != sys.byteorder:
+            self._mmap.close()
+            raise ValueError(f"{path} was built for bank version {self.header['bank_version']}, "
+                             f"not {bank.version}; rebuild it")
+        self.bank = bank
+        self.values = memoryview(self._mmap)[start + size:].cast('d')
+        self.rules = []
+        for info in self.header["rules"]:
+            strides = info.get("strides")
+            terms = None
+            if strides is not None:
+                terms = [(symptom, {w: i * stride for i, w in enumerate(s)})
+                         for symptom, s, stride in zip(info["columns"], info["states"], strides)]
+            self.rules.append((terms, info["offset"]))
+        self.symptoms = sorted({symptom for info in self.header["rules"] for symptom in info["columns"]})
+
+    def signature(self, answers):
+        """Per-rule table index for an answers dict; None where the rule is scored directly."""
+        weights = {symptom: _present_weight(answers.get(symptom)) for symptom in self.symptoms}
+        signature = []
+        for terms, _ in self.rules:
+            index = None
+            if terms is not None:
+                index = 0
+                for symptom, offsets in terms:
+                    offset = offsets.get(weights[symptom])
+                    if offset is None:
+                        index = None
+                        break
+                    index += offset
+            signature.append(index)
+        return tuple(signature)
+
+    def lookup(self, signature):
+        """Certainty per rule for a signature (NOT_REPORTED or None where it is not tabulated)."""
+        return [None if index is None else self.values[offset + index]
+                for (_, offset), index in zip(self.rules, signature)]
+
+    def diagnose(self, answers):
+        """Same result as ``bank.rules.diagnose(answers)``."""
+        rules = self.bank.rules
+        diagnoses = []
+        vectors = None
+        for r, certainty in enumerate(self.lookup(self.signature(answers))):
+            if certainty is None:
+                if vectors is None:
+                    vectors = rules.vectorize(answers)
+                certainty = rules.score_rule(r, *vectors)
+                if certainty is None or certainty * 100 < CERTAINTY_THRESHOLD:
+                    certainty = NOT_REPORTED
+            if certainty != NOT_REPORTED:
+                diagnoses.append({"name": rules.names[r], "dsm_code": rules.dsm_codes[r],
+                                  "question_weight": certainty})
+        return sorted(diagnoses, key=lambda x: x['question_weight'], reverse=True)
+
+    def close(self):
+        self.values.release()
+        self._mmap.close()
+
+
+def print_report(report, out=sys.stdout):
+    for entry in report:
+        out.write(f"{entry['dsm_code']} {entry['name']}\n")
+        if not entry["tabulated"]:
+            out.write("  too many signatures to tabulate\n")
+        else:
+            out.write(f"  {entry['signatures']} signatures, {entry['reachable']} reachable, "
+                      f"{entry['reported']} reported\n")
+            for symptom, status in entry["symptoms"].items():
+                out.write(f"  {symptom:<28} {status}\n")
+        if entry["unused_questions"]:
+            out.write(f"  tagged but not in the rule: {', '.join(entry['unused_questions'])}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the precomputed outcome table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Enumerate every rule's signatures and write the table")
+    build_cmd.add_argument("-o", "--output", default=TABLE_PATH, help=f"Table file (default: {TABLE_PATH})")
+    build_cmd.add_argument("--questions", default=QUESTIONS_PATH, help="Question bank")
+    build_cmd.add_argument("--rules", default=RULES_PATH, help="Diagnosis and validation rules")
+    build_cmd.add_argument("--max-entries", type=int, default=MAX_ENTRIES,
+                           help="Largest rule to tabulate; bigger ones are scored on lookup")
+    build_cmd.add_argument("--quiet", action="store_true", help="Do not print the redundancy report")
+    report_cmd = sub.add_parser("report", help="Print the redundancy report stored in a table")
+    report_cmd.add_argument("table", nargs="?", default=TABLE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        bank = load_bank(args.questions, args.rules)
+        header, tables = build(bank, args.max_entries)
+        write_table(args.output, header, tables)
+        if not args.quiet:
+            print_report(header["report"])
+        return
+    with open(args.table, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            sys.exit(f"{args.table} is not an outcome table")
+        (size,) = struct.unpack('<I', f.read(4))
+        print_report(json.loads(f.read(size))["report"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from engine import SEVERITY_NAMES
+from events import EventPipeline
+
+# A full queue blocks record() this long, and a failed batch is retried this
+# many times (0.1s, 0.2s, ... apart), before results are counted as lost.
+RESULTS_PUT_TIMEOUT = float(os.environ.get('RESULTS_PUT_TIMEOUT', 5.0))
+RESULTS_WRITE_RETRIES = int(os.environ.get('RESULTS_WRITE_RETRIES', 6))
+
+# Certainty histograms use ten 10%-wide buckets.
+CERTAINTY_BUCKETS = 10
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS results ("
+    "id INTEGER PRIMARY KEY, completed_at REAL NOT NULL, day TEXT NOT NULL, "
+    "bank_version TEXT NOT NULL, answers TEXT NOT NULL, instrument TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS results_day ON results (day)",
+    "CREATE INDEX IF NOT EXISTS results_instrument ON results (instrument, day)",
+    "CREATE TABLE IF NOT EXISTS result_diagnoses ("
+    "result_id INTEGER NOT NULL REFERENCES results (id), day TEXT NOT NULL, "
+    "dsm_code TEXT NOT NULL, name TEXT NOT NULL, certainty REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS result_diagnoses_code ON result_diagnoses (dsm_code, day)",
+    "CREATE INDEX IF NOT EXISTS result_diagnoses_day ON result_diagnoses (day)",
+    "CREATE INDEX IF NOT EXISTS result_diagnoses_certainty ON result_diagnoses (certainty)",
+    # Aggregates maintained in the same transaction as the raw rows, per instrument.
+    "CREATE TABLE IF NOT EXISTS agg_assessments ("
+    "instrument TEXT NOT NULL, day TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (instrument, day))",
+    "CREATE TABLE IF NOT EXISTS agg_diagnoses ("
+    "instrument TEXT NOT NULL, day TEXT NOT NULL, dsm_code TEXT NOT NULL, count INTEGER NOT NULL, "
+    "certainty_sum REAL NOT NULL, PRIMARY KEY (instrument, day, dsm_code))",
+    "CREATE TABLE IF NOT EXISTS agg_certainty ("
+    "instrument TEXT NOT NULL, dsm_code TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (instrument, dsm_code, bucket))",
+    "CREATE TABLE IF NOT EXISTS agg_questions ("
+    "instrument TEXT NOT NULL, symptom TEXT NOT NULL, answered INTEGER NOT NULL, positive INTEGER NOT NULL, "
+    "PRIMARY KEY (instrument, symptom))",
+]
+AGGREGATE_TABLES = ('agg_assessments', 'agg_diagnoses', 'agg_certainty', 'agg_questions')
+
+
+def certainty_bucket(certainty):
+    return min(round(certainty * 100) * CERTAINTY_BUCKETS // 100, CERTAINTY_BUCKETS - 1)
+
+
+class ResultStore:
+    """Append-only SQLite log of completed assessments with running aggregates.
+
+    ``record()`` only queues the outcome; a writer thread inserts batches and
+    bumps the aggregate tables in one transaction, so ``stats()`` reads small
+    summary tables instead of scanning results. Every row and aggregate is
+    kept per instrument; databases written before instruments existed are
+    migrated on open, their rows assigned to ``default_instrument``.
+    """
+
+    def __init__(self, path, default_instrument):
+        self.path = path
+        self.default_instrument = default_instrument
+        self._local = threading.local()
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(results)")]
+            migrate = bool(columns) and 'instrument' not in columns
+            if migrate:
+                conn.execute("ALTER TABLE results ADD COLUMN instrument TEXT NOT NULL DEFAULT ''")
+                conn.execute("UPDATE results SET instrument = ?", (default_instrument,))
+                for table in AGGREGATE_TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            if migrate:
+                self._rebuild_aggregates(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self.pipeline = EventPipeline(lambda: self, put_timeout=RESULTS_PUT_TIMEOUT,
+                                      retries=RESULTS_WRITE_RETRIES, on_lost=self._lost)
+        atexit.register(self.pipeline.close)
+
+    def _connect(self):
+        # Same per-thread, per-process connections as the SQLite session store.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=30.0)
+            self._local.conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _lost(self, reason, count):
+        logging.error(f"Lost {count} results ({reason}).")
+        metrics.results_lost.inc(reason, amount=count)
+        metrics.flush()
+
+    def record(self, instrument, bank_version, answers, diagnoses):
+        self.pipeline.emit('result', instrument=instrument, bank_version=bank_version,
+                           answers=answers, diagnoses=diagnoses)
+
+    def _rebuild_aggregates(self, conn):
+        """Recompute every aggregate table from the raw rows."""
+        assessments = {}
+        question_counts = {}
+        for instrument, day, answers in conn.execute("SELECT instrument, day, answers FROM results"):
+            assessments[instrument, day] = assessments.get((instrument, day), 0) + 1
+            for symptom, severity in json.loads(answers).items():
+                if severity == "Skipped":
+                    continue
+                counts = question_counts.setdefault((instrument, symptom), [0, 0])
+                counts[0] += 1
+                counts[1] += severity != SEVERITY_NAMES[0]
+        diagnosis_counts = {}
+        certainty_counts = {}
+        for instrument, day, code, certainty in conn.execute(
+            "SELECT r.instrument, d.day, d.dsm_code, d.certainty "
+            "FROM result_diagnoses d JOIN results r ON r.id = d.result_id"
+        ):
+            counts = diagnosis_counts.setdefault((instrument, day, code), [0, 0.0])
+            counts[0] += 1
+            counts[1] += certainty
+            key = (instrument, code, certainty_bucket(certainty))
+            certainty_counts[key] = certainty_counts.get(key, 0) + 1
+        self._bump_aggregates(conn, assessments, diagnosis_counts, certainty_counts, question_counts)
+
+    def write(self, batch):
+        diagnosis_rows = []
+        assessments = {}
+        diagnosis_counts = {}
+        certainty_counts = {}
+        question_counts = {}
+        with self._connect() as conn:
+            for _, ts, fields in batch:
+                day = time.strftime('%Y-%m-%d', time.gmtime(ts))
+                instrument = fields.get('instrument') or self.default_instrument
+                answers = {}
+                for symptom, ans in fields['answers'].items():
+                    if ans.get('was_skipped', False):
+                        answers[symptom] = "Skipped"
+                        continue
+                    answers[symptom] = SEVERITY_NAMES[ans['severity']]
+                    counts = question_counts.setdefault((instrument, symptom), [0, 0])
+                    counts[0] += 1
+                    counts[1] += ans['value'] == 'yes'
+                result_id = conn.execute(
+                    "INSERT INTO results (completed_at, day, bank_version, answers, instrument) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (ts, day, fields['bank_version'], json.dumps(answers, separators=(',', ':')), instrument)
+                ).lastrowid
+                assessments[instrument, day] = assessments.get((instrument, day), 0) + 1
+                for d in fields['diagnoses']:
+                    certainty = d['question_weight']
+                    diagnosis_rows.append((result_id, day, d['dsm_code'], d['name'], certainty))
+                    counts = diagnosis_counts.setdefault((instrument, day, d['dsm_code']), [0, 0.0])
+                    counts[0] += 1
+                    counts[1] += certainty
+                    key = (instrument, d['dsm_code'], certainty_bucket(certainty))
+                    certainty_counts[key] = certainty_counts.get(key, 0) + 1
+
+            conn.executemany(
+                "INSERT INTO result_diagnoses (result_id, day, dsm_code, name, certainty) "
+                "VALUES (?, ?, ?, ?, ?)", diagnosis_rows
+            )
+            self._bump_aggregates(conn, assessments, diagnosis_counts, certainty_counts, question_counts)
+
+    def _bump_aggregates(self, conn, assessments, diagnosis_counts, certainty_counts, question_counts):
+        conn.executemany(
+            "INSERT INTO agg_assessments (instrument, day, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (instrument, day) DO UPDATE SET count = count + excluded.count",
+            [(instrument, day, n) for (instrument, day), n in assessments.items()]
+        )
+        conn.executemany(
+            "INSERT INTO agg_diagnoses (instrument, day, dsm_code, count, certainty_sum) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (instrument, day, dsm_code) DO UPDATE SET count = count + excluded.count, "
+            "certainty_sum = certainty_sum + excluded.certainty_sum",
+            [key + (n, total) for key, (n, total) in diagnosis_counts.items()]
+        )
+        conn.executemany(
+            "INSERT INTO agg_certainty (instrument, dsm_code, bucket, count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (instrument, dsm_code, bucket) DO UPDATE SET count = count + excluded.count",
+            [key + (n,) for key, n in certainty_counts.items()]
+        )
+        conn.executemany(
+            "INSERT INTO agg_questions (instrument, symptom, answered, positive) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (instrument, symptom) DO UPDATE SET answered = answered + excluded.answered, "
+            "positive = positive + excluded.positive",
+            [key + (answered, positive) for key, (answered, positive) in question_counts.items()]
+        )
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+            del self._local.conn, self._local.pid
+
+    def stats(self, instrument, since=None, until=None):
+        """Aggregate statistics of one instrument; ``since``/``until`` (YYYY-MM-DD, inclusive) limit prevalence."""
+        conn = self._connect()
+        day_range = "instrument = ? AND day >= coalesce(?, day) AND day <= coalesce(?, day)"
+        total = conn.execute(
+            f"SELECT coalesce(sum(count), 0) FROM agg_assessments WHERE {day_range}", (instrument, since, until)
+        ).fetchone()[0]
+        prevalence = [
+            {
+                "dsm_code": code,
+                "count": count,
+                "rate": count / total if total else 0.0,
+                "mean_certainty": certainty_sum / count,
+            }
+            for code, count, certainty_sum in conn.execute(
+                f"SELECT dsm_code, sum(count), sum(certainty_sum) FROM agg_diagnoses "
+                f"WHERE {day_range} GROUP BY dsm_code ORDER BY sum(count) DESC", (instrument, since, until)
+            )
+        ]
+        certainty = {}
+        for code, bucket, count in conn.execute(
+            "SELECT dsm_code, bucket, count FROM agg_certainty WHERE instrument = ?", (instrument,)
+        ):
+            certainty.setdefault(code, [0] * CERTAINTY_BUCKETS)[bucket] = count
+        questions = [
+            {"symptom": symptom, "answered": answered, "positive": positive,
+             "positive_rate": positive / answered if answered else 0.0}
+            for symptom, answered, positive in conn.execute(
+                "SELECT symptom, answered, positive FROM agg_questions WHERE instrument = ? ORDER BY symptom",
+                (instrument,)
+            )
+        ]
+        return {
+            "instrument": instrument,
+            "assessments": total,
+            "prevalence": prevalence,
+            "certainty_buckets": [i * 100 // CERTAINTY_BUCKETS for i in range(CERTAINTY_BUCKETS)],
+            "certainty": certainty,
+            "questions": questions,
+        }
@@ -0,0 +1,293 @@
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import (
+    SecureCookieSessionInterface, SessionInterface, SessionMixin, session_json_serializer
+)
+from werkzeug.datastructures import CallbackDict
+
+from engine import record_answer, severity_code, skipped_answer
+
+# Per-question bytes used by the compact encoding: 0 means the question has no
+# entry yet, 1 that it was skipped, and 2 + n that it was answered with
+# severity code n.
+_UNANSWERED = 0
+_SKIPPED = 1
+_ANSWERED = 2
+
+
+class CompactSessionSerializer:
+    """Session serializer that stores ``answers`` as one byte per question.
+
+    Weights and DSM codes are recomputed on load from the bank version the
+    session is pinned to (``bank_version``, of the instrument named by
+    ``instrument`` when the registry serves several), so only the severity
+    code (or the skipped marker) has to travel. The per-rule ``tally`` is
+    packed next to it as little-endian integers (two bytes per count, four
+    per weight, two per any_of group), so it survives the round trip
+    without being rebuilt from the answers.
+    """
+
+    def __init__(self, registry, inner=session_json_serializer):
+        self.registry = registry
+        self.inner = inner
+
+    def bank(self, value):
+        registry = self.registry
+        if value.get('instrument') is not None:
+            registry = registry.registry(value['instrument'])
+            if registry is None:
+                return None
+        version = value.get('bank_version')
+        if version is None:
+            return registry.current()
+        return registry.get(version)
+
+    def encode_answers(self, bank, answers):
+        codes = bytearray(len(bank.questions))
+        for symptom, ans in answers.items():
+            pos = bank.graph.ids.get(symptom)
+            if pos is None:
+                raise ValueError(f"Unknown symptom {symptom!r}")
+            if ans.get('was_skipped', False):
+                codes[pos] = _SKIPPED
+            else:
+                severity = ans.get('severity', '')
+                if isinstance(severity, str):
+                    severity = severity_code(severity)
+                codes[pos] = _ANSWERED + severity
+        return bytes(codes)
+
+    def decode_answers(self, bank, codes):
+        answers = {}
+        for q, code in zip(bank.questions, codes):
+            if code == _UNANSWERED:
+                continue
+            if code == _SKIPPED:
+                answers[q['symptom']] = skipped_answer(q)
+            else:
+                answers[q['symptom']] = record_answer(q, code - _ANSWERED)
+        return answers
+
+    def tally_format(self, bank):
+        rules = len(bank.rules.slots)
+        return struct.Struct(f'<{rules}H{rules}i{bank.rules.group_count}H')
+
+    def encode_tally(self, bank, tally):
+        try:
+            return self.tally_format(bank).pack(*tally['counts'], *tally['weights'], *tally['groups'])
+        except (KeyError, TypeError, struct.error) as e:
+            raise ValueError(f"Tally does not fit bank {bank.version}") from e
+
+    def decode_tally(self, bank, packed):
+        fmt = self.tally_format(bank)
+        if len(packed) != fmt.size:
+            return None
+        values = list(fmt.unpack(packed))
+        rules = len(bank.rules.slots)
+        return {"counts": values[:rules], "weights": values[rules:2 * rules], "groups": values[2 * rules:]}
+
+    def dumps(self, value):
+        answers = value.get('answers')
+        bank = self.bank(value)
+        if isinstance(answers, dict) and bank is not None:
+            try:
+                value = dict(value, answers=self.encode_answers(bank, answers))
+                if value.get('tally') is not None:
+                    value['tally'] = self.encode_tally(bank, value['tally'])
+            except ValueError:
+                # Leave the plain dicts in; they round-trip unchanged.
+                value = dict(value, answers=answers)
+        return self.inner.dumps(value)
+
+    def loads(self, value):
+        data = self.inner.loads(value)
+        if isinstance(data.get('answers'), bytes):
+            bank = self.bank(data)
+            if bank is None:
+                # The pinned version (or instrument) is gone from memory and disk; start over.
+                return {}
+            data['answers'] = self.decode_answers(bank, data['answers'])
+            if isinstance(data.get('tally'), bytes):
+                tally = self.decode_tally(bank, data['tally'])
+                if tally is None:
+                    # Packed for another bank layout; the routes rebuild it from the answers.
+                    data.pop('tally')
+                else:
+                    data['tally'] = tally
+        return data
+
+
+class CompactCookieSessionInterface(SecureCookieSessionInterface):
+    """Flask's signed-cookie sessions with the compact answers encoding."""
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+
+class MemoryStore:
+    """In-process LRU of serialized sessions with TTL eviction.
+
+    Only valid with a single worker process; use SqliteStore behind gunicorn.
+    """
+
+    def __init__(self, maxsize=10000, ttl=7200):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is None:
+                return None
+            expires, payload = item
+            if expires < time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return payload
+
+    def set(self, sid, payload):
+        with self._lock:
+            self._data[sid] = (time.time() + self.ttl, payload)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class SqliteStore:
+    """Sessions in a SQLite file shared by every worker on the host."""
+
+    # Expired rows are purged on every Nth write rather than on each request.
+    purge_every = 500
+
+    def __init__(self, path, ttl=7200):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(sid TEXT PRIMARY KEY, payload TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork so gunicorn workers
+        # never share a handle inherited from the master.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT payload FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, payload):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, payload, expires) VALUES (?, ?, ?)",
+                (sid, payload, now + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in a store; the cookie only carries a random session id."""
+
+    def __init__(self, store, serializer):
+        self.store = store
+        self.serializer = serializer
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            payload = self.store.get(sid)
+            if payload is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(payload), sid=sid)
+                except Exception:
+                    pass
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)))
+        if session.new or (session.permanent and app.config["SESSION_REFRESH_EACH_REQUEST"]):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def configure_sessions(app, registry):
+    """Pick the session backend from SESSION_BACKEND: cookie (default), memory or sqlite."""
+    backend = os.environ.get('SESSION_BACKEND', 'cookie').lower()
+    ttl = int(os.environ.get('SESSION_TTL', 7200))
+    serializer = CompactSessionSerializer(registry)
+    if backend == 'cookie':
+        app.session_interface = CompactCookieSessionInterface(serializer)
+    elif backend == 'memory':
+        store = MemoryStore(int(os.environ.get('SESSION_MAX_ENTRIES', 10000)), ttl)
+        app.session_interface = ServerSideSessionInterface(store, serializer)
+    elif backend == 'sqlite':
+        store = SqliteStore(os.environ.get('SESSION_SQLITE_PATH', 'sessions.sqlite3'), ttl)
+        app.session_interface = ServerSideSessionInterface(store, serializer)
+    else:
+        raise RuntimeError(f"Unknown SESSION_BACKEND {backend!r}")
@@ -17,5 +17,180 @@ function goBack() {
     if (isSubmitting) return;
     isSubmitting = true;
     showLoading();
-    window.location.href = "/ask?direction=back";
+    window.location.href = document.getElementById("assessment-form").getAttribute("action") + "?direction=back";
 }
+
+
+// Client-side assessment flow (/assessment). The question bank is fetched once;
+// dependencies and validation are evaluated here, and the server is only used
+// to persist answers and to compute the final result.
+const flow = {
+    questions: [],
+    rules: [],
+    answers: {},
+    history: [],
+    index: 0,
+    answersUrl: "/api/answers",
+    resultUrl: "/api/result",
+    pending: Promise.resolve()
+};
+
+function isYes(severity) {
+    return !["no", "none", ""].includes((severity || "").toLowerCase());
+}
+
+function isSkipped(q) {
+    return q.dependencies.length > 0 &&
+        !q.dependencies.some(dep => isYes(flow.answers[dep]));
+}
+
+function validationError(symptom, severity) {
+    if (!isYes(severity)) return null;
+    for (const rule of flow.rules) {
+        if (rule.condition !== "not_simultaneous" || !rule.symptoms.includes(symptom)) continue;
+        if (rule.symptoms.some(other => other !== symptom && isYes(flow.answers[other]))) {
+            return rule.message;
+        }
+    }
+    return null;
+}
+
+function persistAnswers(payload) {
+    flow.pending = flow.pending.then(() => fetch(flow.answersUrl, {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify(payload),
+        credentials: "same-origin",
+        keepalive: true
+    })).then(response => {
+        if (!response.ok) throw new Error("Could not save your answer.");
+    });
+    return flow.pending;
+}
+
+function showOnly(id) {
+    for (const section of ["app-question", "app-result", "app-error"]) {
+        document.getElementById(section).style.display = section === id ? "block" : "none";
+    }
+    document.getElementById("loading").style.display = "none";
+}
+
+function showError(message) {
+    document.getElementById("app-error-message").textContent = message;
+    showOnly("app-error");
+}
+
+function nextIndex(from) {
+    let idx = from;
+    while (idx < flow.questions.length && isSkipped(flow.questions[idx])) idx++;
+    return idx;
+}
+
+function renderQuestion() {
+    const q = flow.questions[flow.index];
+    document.getElementById("app-progress").textContent =
+        `Question ${flow.index + 1} of ${flow.questions.length}`;
+    document.getElementById("app-question-text").textContent = q.question;
+    document.getElementById("app-weight").textContent =
+        `Question Weight: ${q.question_weight * 100}%`;
+    document.getElementById("app-back").disabled = flow.history.length === 0;
+
+    const buttons = document.getElementById("app-buttons");
+    buttons.replaceChildren();
+    const choices = q.binary ? ["No", "Yes"] : ["No", "Mild", "Moderate", "Severe"];
+    for (const choice of choices) {
+        const button = document.createElement("button");
+        button.type = "button";
+        button.textContent = choice;
+        button.onclick = () => appAnswer(choice === "No" ? "None" : choice);
+        buttons.appendChild(button);
+    }
+    showOnly("app-question");
+}
+
+function renderResult(diagnoses) {
+    const items = document.getElementById("app-result-items");
+    items.replaceChildren();
+    if (diagnoses.length === 0) {
+        const item = document.createElement("div");
+        item.className = "diagnosis-item";
+        item.textContent = "No diagnosis could be determined based on your responses.";
+        items.appendChild(item);
+    }
+    for (const d of diagnoses) {
+        const item = document.createElement("div");
+        item.className = "diagnosis-item";
+        const name = document.createElement("div");
+        name.className = "diagnosis-item-name";
+        name.textContent = d.name;
+        const details = document.createElement("div");
+        details.className = "diagnosis-item-details";
+        details.textContent =
+            `DSM-5-TR: ${d.dsm_code} | Certainty: ${Math.round(d.question_weight * 100)}%`;
+        item.append(name, details);
+        items.appendChild(item);
+    }
+    showOnly("app-result");
+}
+
+async function finishAssessment() {
+    showLoading();
+    try {
+        await flow.pending;
+        const response = await fetch(flow.resultUrl, {credentials: "same-origin"});
+        const body = await response.json();
+        if (!response.ok) throw new Error(body.error);
+        renderResult(body.diagnoses);
+    } catch (e) {
+        showError(e.message || "An unexpected error occurred. Please try again later.");
+    }
+}
+
+function advance(from) {
+    flow.index = nextIndex(from);
+    if (flow.index < flow.questions.length) {
+        renderQuestion();
+    } else {
+        finishAssessment();
+    }
+}
+
+function appAnswer(severity) {
+    const q = flow.questions[flow.index];
+    const error = validationError(q.symptom, severity);
+    if (error) {
+        showError(error);
+        return;
+    }
+    flow.answers[q.symptom] = severity;
+    flow.history.push(flow.index);
+    persistAnswers({answers: {[q.symptom]: severity}}).catch(e => showError(e.message));
+    advance(flow.index + 1);
+}
+
+function appGoBack() {
+    if (flow.history.length === 0) return;
+    flow.index = flow.history.pop();
+    renderQuestion();
+}
+
+async function startAssessmentApp(root) {
+    showLoading();
+    try {
+        flow.answersUrl = root.dataset.answersUrl;
+        flow.resultUrl = root.dataset.resultUrl;
+        const response = await fetch(root.dataset.questionsUrl);
+        const bank = await response.json();
+        flow.questions = bank.questions;
+        flow.rules = bank.validation_rules;
+        await persistAnswers({answers: {}, reset: true, version: bank.version});
+        advance(0);
+    } catch (e) {
+        showError("An unexpected error occurred. Please try again later.");
+    }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const root = document.getElementById("assessment-app");
+    if (root) startAssessmentApp(root);
+});
@@ -0,0 +1,394 @@
+"""Sensitivity sweep of the scoring constants over a corpus of answer sets.
+
+Every combination of the values given for the scoring constants is applied
+to every answer set, reporting per disorder how many sets are diagnosed and
+how many of them flip compared with the current constants:
+
+    python sweep.py results.sqlite3 -p symptom_threshold=0.6,0.7,0.8 \\
+        -p certainty_threshold=30,40,50 -p mild=0.4,0.5 -o sweep.jsonl
+
+Instead of scoring sets one by one, the corpus is reduced once to how often
+each pattern of slot answers occurs per rule. For each set of weights the
+patterns are grouped by which weights they add up, each group's certainty
+is computed once and sorted, and every symptom/certainty threshold pair
+is then answered with a few bisections. Only groups that land within
+TIE_MARGIN of a cut-off are summed again pattern by pattern, in rule order,
+so every decision is the one the engine itself would make.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from collections import Counter
+
+from bank import QUESTIONS_PATH, RULES_PATH, load_bank
+from batch import iter_csv_records
+from instruments import DEFAULT_INSTRUMENT
+from engine import (BASE_WEIGHT, CERTAINTY_THRESHOLD, MIN_WEIGHT, SEVERITY_ADJUSTMENT, SEVERITY_MILD,
+                    SEVERITY_MODERATE, SEVERITY_SEVERE, SYMPTOM_THRESHOLD, WEIGHT_REDUCTION, rule_threshold,
+                    severity_weight)
+
+DEFAULTS = {
+    "symptom_threshold": SYMPTOM_THRESHOLD,
+    "certainty_threshold": CERTAINTY_THRESHOLD,
+    "mild": SEVERITY_ADJUSTMENT["mild"],
+    "moderate": SEVERITY_ADJUSTMENT["moderate"],
+    "severe": SEVERITY_ADJUSTMENT["severe"],
+    "base_weight": BASE_WEIGHT,
+    "reduction": WEIGHT_REDUCTION,
+    "min_weight": MIN_WEIGHT,
+}
+WEIGHT_PARAMS = ("mild", "moderate", "severe", "base_weight", "reduction", "min_weight")
+SEVERITY_PARAMS = {SEVERITY_MILD: "mild", SEVERITY_MODERATE: "moderate", SEVERITY_SEVERE: "severe"}
+# Group totals (in hundredths) this close to cut-off x slots are ties and get
+# summed again pattern by pattern.
+TIE_MARGIN = 1e-6
+
+
+def slot_sums(pattern, weights):
+    """(present slots, summed weight) of one rule pattern, in the engine's order."""
+    count = 0
+    total = 0.0
+    for members in pattern:
+        for c in members:
+            if c >= 0 and weights[c] > 0:
+                count += 1
+                total += weights[c]
+                break
+    return count, total
+
+
+class Corpus:
+    """Answer sets reduced to how often each pattern of slot answers occurs, per rule.
+
+    A pattern holds, for every slot of the rule, the answer class of each
+    member symptom: an index into ``classes`` ((number of DSM codes,
+    severity code)), or -1 when the answer cannot count.
+    """
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.classes = []
+        self._class_ids = {}
+        self.patterns = [Counter() for _ in bank.rules.slots]
+        self.size = 0
+        self.invalid = 0
+
+    def _class(self, ans):
+        if not ans or ans.get('value') != 'yes' or ans['severity'] not in SEVERITY_PARAMS:
+            return -1
+        key = (len(ans.get('dsm_codes', [])), ans['severity'])
+        c = self._class_ids.get(key)
+        if c is None:
+            c = self._class_ids[key] = len(self.classes)
+            self.classes.append(key)
+        return c
+
+    def add(self, severities):
+        try:
+            answers = self.bank.replay_answers(severities)
+        except ValueError:
+            self.invalid += 1
+            return
+        self.size += 1
+        names = self.bank.rules.column_names
+        classes = {}
+        for r, slots in enumerate(self.bank.rules.slots):
+            pattern = []
+            for cols in slots:
+                for col in cols:
+                    if col not in classes:
+                        classes[col] = self._class(answers.get(names[col]))
+                pattern.append(tuple(classes[col] for col in cols))
+            self.patterns[r][tuple(pattern)] += 1
+
+    def weights(self, params):
+        return [severity_weight(n, params[SEVERITY_PARAMS[code]], params["base_weight"],
+                                params["reduction"], params["min_weight"])
+                for n, code in self.classes]
+
+
+def diagnosed(count, total, threshold, cutoff):
+    return count >= threshold and total / count * 100 >= cutoff
+
+
+class RulePatterns:
+    """One rule's patterns grouped by how many slots each answer class fills.
+
+    Groups only change when a class's weight drops to zero, so they are
+    cached per set of counting classes and shared by every weight
+    configuration that keeps the same classes.
+    """
+
+    def __init__(self, patterns, baseline):
+        # baseline: pattern -> whether the current constants diagnose it.
+        self.patterns = [(pattern, n, baseline[pattern]) for pattern, n in patterns.items()]
+        self._levels = {}
+
+    def levels(self, counting):
+        """Groups per number of present slots: [(count, packed slot counts per class, sets,
+        sets diagnosed at baseline, patterns)].
+
+        ``packed[c]`` holds every group's slot count for class ``c`` in its
+        own 32-bit field of one integer, so a group total for any weights
+        is a handful of big-integer multiplications.
+        """
+        cached = self._levels.get(counting)
+        if cached is not None:
+            return cached
+        groups = {}
+        for pattern, n, was in self.patterns:
+            present = Counter()
+            for members in pattern:
+                for c in members:
+                    if c >= 0 and counting[c]:
+                        present[c] += 1
+                        break
+            groups.setdefault(tuple(sorted(present.items())), []).append((pattern, n, was))
+        by_count = {}
+        for key, members in groups.items():
+            count = sum(n for _, n in key)
+            if count:
+                by_count.setdefault(count, []).append((dict(key), members))
+        cached = self._levels[counting] = []
+        for count, items in sorted(by_count.items()):
+            classes = {c for key, _ in items for c in key}
+            packed = {c: int.from_bytes(array('I', [key.get(c, 0) for key, _ in items]).tobytes(), sys.byteorder)
+                      for c in classes}
+            cached.append((count, packed,
+                           [sum(n for _, n, _ in members) for _, members in items],
+                           [sum(n for _, n, was in members if was) for _, members in items],
+                           [members for _, members in items]))
+        return cached
+
+
+class RuleSweep:
+    """One rule under one set of weights, ready for threshold queries."""
+
+    def __init__(self, rule_patterns, weights):
+        self.weights = weights
+        # Weights have two decimals, so totals in hundredths are exact integers.
+        hundredths = [round(w * 100) for w in weights]
+        self.levels = []
+        for count, packed, sets, diagnosed_sets, members in rule_patterns.levels(tuple(w > 0 for w in weights)):
+            if count * max(hundredths[c] for c in packed) >= 1 << 32:
+                raise ValueError(f"Weights up to {max(weights)} overflow the packed totals")
+            packed_totals = sum(hundredths[c] * counts for c, counts in packed.items())
+            totals = array('I')
+            totals.frombytes(packed_totals.to_bytes(4 * len(sets), sys.byteorder))
+            order = sorted(range(len(sets)), key=totals.__getitem__)
+            suffix_sets = list(itertools.accumulate(map(sets.__getitem__, reversed(order)), initial=0))[::-1]
+            suffix_base = list(itertools.accumulate(map(diagnosed_sets.__getitem__, reversed(order)), initial=0))[::-1]
+            self.levels.append((count, list(map(totals.__getitem__, order)), suffix_sets, suffix_base,
+                                list(map(members.__getitem__, order))))
+
+    def query(self, threshold, cutoff):
+        """(sets diagnosed, of those also diagnosed under the current constants)."""
+        positive = both = 0
+        for count, totals, suffix_sets, suffix_base, members in self.levels:
+            if count < threshold:
+                continue
+            # Diagnosed when total / count >= cutoff; exact ties go by the engine's float sum.
+            lo = bisect.bisect_left(totals, cutoff * count - TIE_MARGIN)
+            hi = bisect.bisect_left(totals, cutoff * count + TIE_MARGIN)
+            positive += suffix_sets[hi]
+            both += suffix_base[hi]
+            for i in range(lo, hi):
+                for pattern, n, was in members[i]:
+                    if diagnosed(*slot_sums(pattern, self.weights), threshold, cutoff):
+                        positive += n
+                        both += n if was else 0
+        return positive, both
+
+
+def baseline(corpus):
+    """Per rule, its RulePatterns (decided with the current constants) and the sets diagnosed."""
+    weights = corpus.weights(DEFAULTS)
+    rules = corpus.bank.rules
+    rule_patterns = []
+    totals = []
+    for r, patterns in enumerate(corpus.patterns):
+        threshold = rules.thresholds[r]
+        decided = {}
+        for pattern in patterns:
+            count, total = slot_sums(pattern, weights)
+            decided[pattern] = diagnosed(count, total, threshold, CERTAINTY_THRESHOLD)
+        rule_patterns.append(RulePatterns(patterns, decided))
+        totals.append(sum(n for pattern, n in patterns.items() if decided[pattern]))
+    return rule_patterns, totals
+
+
+def sweep_weights(corpus, rule_patterns, base_totals, weight_params, rule_grid):
+    """Results for one set of weight constants across every (symptom, certainty) threshold pair."""
+    rules = corpus.bank.rules
+    params = dict(DEFAULTS, **weight_params)
+    weights = corpus.weights(params)
+    sweeps = [RuleSweep(patterns, weights) for patterns in rule_patterns]
+    results = []
+    for symptom_threshold, cutoff in rule_grid:
+        disorders = {}
+        for r, rule_sweep in enumerate(sweeps):
+            positive, both = rule_sweep.query(rule_threshold(len(rules.slots[r]), symptom_threshold), cutoff)
+            disorders[rules.dsm_codes[r]] = {
+                "positive": positive,
+                "rate": positive / corpus.size if corpus.size else 0.0,
+                "flips": positive + base_totals[r] - 2 * both,
+            }
+        results.append(dict(params, symptom_threshold=symptom_threshold, certainty_threshold=cutoff,
+                            disorders=disorders))
+    return results
+
+
+def iter_configs(grid):
+    """Yield (weight params, [(symptom threshold, certainty threshold), ...]) with weights outermost."""
+    rule_grid = list(itertools.product(grid["symptom_threshold"], grid["certainty_threshold"]))
+    for values in itertools.product(*(grid[p] for p in WEIGHT_PARAMS)):
+        yield dict(zip(WEIGHT_PARAMS, values)), rule_grid
+
+
+# Set once per worker process by _init_worker, like batch.py.
+_worker_state = None
+
+
+def _init_worker(corpus, rule_patterns, base_totals):
+    global _worker_state
+    _worker_state = (corpus, rule_patterns, base_totals)
+
+
+def _sweep_chunk(chunk):
+    return [sweep_weights(*_worker_state, weight_params, rule_grid) for weight_params, rule_grid in chunk]
+
+
+def run_sweep(corpus, grid, workers=1, chunk_size=8):
+    """Yield one result per grid point, in grid order."""
+    rule_patterns, base_totals = baseline(corpus)
+    configs = iter_configs(grid)
+    if workers == 1:
+        for weight_params, rule_grid in configs:
+            yield from sweep_weights(corpus, rule_patterns, base_totals, weight_params, rule_grid)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = iter(lambda: list(itertools.islice(configs, chunk_size)), [])
+    with ProcessPoolExecutor(max_workers=workers or None, initializer=_init_worker,
+                             initargs=(corpus, rule_patterns, base_totals)) as pool:
+        for chunk in pool.map(_sweep_chunk, chunks):
+            for results in chunk:
+                yield from results
+
+
+def iter_answer_sets(path, fmt, instrument=DEFAULT_INSTRUMENT):
+    """Yield severities dicts ({symptom: severity}) from a JSONL, CSV or results database.
+
+    A results database holds every instrument's assessments; only ``instrument``'s are read.
+    """
+    if fmt == "results":
+        conn = sqlite3.connect(path)
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(results)")]
+            if "instrument" in columns:
+                rows = conn.execute("SELECT answers FROM results WHERE instrument = ? ORDER BY id", (instrument,))
+            else:
+                # Written before instruments existed: everything belongs to the default one.
+                rows = conn.execute("SELECT answers FROM results ORDER BY id")
+            for (answers,) in rows:
+                yield {k: v for k, v in json.loads(answers).items() if v != "Skipped"}
+        finally:
+            conn.close()
+        return
+    with (sys.stdin if path == "-" else open(path, "r", newline="")) as f:
+        if fmt == "csv":
+            for _, record in iter_csv_records(f):
+                yield record["answers"]
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+                continue
+            yield record.get("answers") if isinstance(record, dict) else None
+
+
+def load_corpus(bank, path, fmt, instrument=DEFAULT_INSTRUMENT):
+    corpus = Corpus(bank)
+    for severities in iter_answer_sets(path, fmt, instrument):
+        if not isinstance(severities, dict) or not all(isinstance(v, str) for v in severities.values()):
+            corpus.invalid += 1
+            continue
+        corpus.add(severities)
+    return corpus
+
+
+def parse_grid(grid_path, overrides):
+    """{param: [values]}: DEFAULTS, then the JSON grid file, then ``name=v1,v2`` overrides."""
+    grid = {name: [value] for name, value in DEFAULTS.items()}
+    if grid_path:
+        with open(grid_path) as f:
+            for name, values in json.load(f).items():
+                grid[name] = values if isinstance(values, list) else [values]
+    for item in overrides:
+        name, _, values = item.partition("=")
+        grid[name.strip()] = [float(v) for v in values.split(",") if v.strip()]
+    unknown = set(grid) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s): {', '.join(sorted(unknown))}; "
+                         f"expected {', '.join(DEFAULTS)}")
+    return grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep the scoring constants over stored answer sets.")
+    parser.add_argument("corpus", help="JSONL or CSV of answer sets (as for batch.py), a results "
+                                       "database, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output, one line per grid point")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help=f"Values to try for one of: {', '.join(DEFAULTS)}")
+    parser.add_argument("--grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("--format", choices=["jsonl", "csv", "results"],
+                        help="Corpus format (default: from the file extension, else jsonl)")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Question bank to replay against")
+    parser.add_argument("--rules", default=RULES_PATH, help="Diagnosis and validation rules")
+    parser.add_argument("--instrument", default=DEFAULT_INSTRUMENT,
+                        help="Instrument whose stored results to read from a results database; "
+                             "pass its --questions and --rules too (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Worker processes; 0 uses every CPU (default: 1, no pool)")
+    args = parser.parse_args(argv)
+
+    try:
+        grid = parse_grid(args.grid, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.corpus)[1].lower()
+        fmt = "csv" if ext == ".csv" else "results" if ext in (".sqlite3", ".db") else "jsonl"
+
+    started = time.perf_counter()
+    corpus = load_corpus(load_bank(args.questions, args.rules), args.corpus, fmt, args.instrument)
+    loaded = time.perf_counter()
+    dst = sys.stdout if args.output == "-" else open(args.output, "w")
+    configs = 0
+    try:
+        for result in run_sweep(corpus, grid, args.workers):
+            dst.write(json.dumps(result) + "\n")
+            configs += 1
+    finally:
+        if dst is not sys.stdout:
+            dst.close()
+    patterns = sum(len(p) for p in corpus.patterns)
+    sys.stderr.write(f"{corpus.size} answer sets ({corpus.invalid} invalid, {patterns} rule patterns) "
+                     f"loaded in {loaded - started:.1f}s; {configs} configurations in "
+                     f"{time.perf_counter() - loaded:.1f}s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules live at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank import load_bank  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def bank():
+    return load_bank(cache_dir=None)
+
+
+def random_severities(bank, rnd, answered=0.7):
+    """A random, possibly partial answer set, including unrecognised severity strings."""
+    choices = ["No", "None", "Mild", "Moderate", "Severe", "Yes", "unsure"]
+    return {q["symptom"]: rnd.choice(choices) for q in bank.questions if rnd.random() < answered}
+
+
+@pytest.fixture(scope="session")
+def answer_sets(bank):
+    """Replayed answers dicts for 3000 random answer sets that pass validation."""
+    rnd = random.Random(1234)
+    sets = []
+    while len(sets) < 3000:
+        try:
+            sets.append(bank.replay_answers(random_severities(bank, rnd)))
+        except ValueError:
+            continue
+    return sets
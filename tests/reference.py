@@ -0,0 +1,32 @@
+"""Baseline implementations the optimised code paths are checked against."""
+import math
+
+from engine import CERTAINTY_THRESHOLD, SYMPTOM_THRESHOLD
+
+
+def reference_diagnose(rules, answers):
+    """The original per-rule loop the compiled scorer replaced."""
+    diagnoses = []
+    for rule in rules:
+        present_count = 0
+        total_weight = 0.0
+        for sym in rule["symptoms"]:
+            candidates = sym["any_of"] if isinstance(sym, dict) and "any_of" in sym else [sym]
+            for candidate in candidates:
+                ans = answers.get(candidate, {})
+                if ans.get('value', 'no') == 'yes' and ans.get('question_weight', 0) > 0:
+                    present_count += 1
+                    total_weight += ans.get('question_weight', 0)
+                    break
+        threshold = math.ceil(len(rule["symptoms"]) * SYMPTOM_THRESHOLD)
+        if present_count >= threshold and present_count > 0:
+            diagnoses.append({
+                "name": rule["name"],
+                "dsm_code": rule["dsm_code"],
+                "question_weight": total_weight / present_count
+            })
+    return sorted(
+        [d for d in diagnoses if d['question_weight'] * 100 >= CERTAINTY_THRESHOLD],
+        key=lambda d: d['question_weight'],
+        reverse=True
+    )
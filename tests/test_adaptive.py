@@ -0,0 +1,25 @@
+import random
+
+from engine import record_answer
+from reference import reference_diagnose
+
+
+def test_adaptive_walk_reports_the_full_walk_diagnoses(bank):
+    rnd = random.Random(11)
+    walks = 0
+    while walks < 300:
+        severities = {q["symptom"]: rnd.choice(["No", "Mild", "Moderate", "Severe"]) if not q.get("binary")
+                      else rnd.choice(["No", "Yes"]) for q in bank.questions}
+        try:
+            full = bank.replay_answers(severities)
+        except ValueError:
+            continue
+        walks += 1
+        answers = {}
+        current, _ = bank.planner.next_question(answers)
+        while current is not None:
+            q = bank.questions[current]
+            answers[q["symptom"]] = record_answer(q, severities[q["symptom"]])
+            current, _ = bank.planner.next_question(answers)
+        adaptive_codes = {d["dsm_code"] for d in bank.rules.diagnose(answers)}
+        assert adaptive_codes == {d["dsm_code"] for d in reference_diagnose(bank.rules.rules, full)}
@@ -0,0 +1,6 @@
+from reference import reference_diagnose
+
+
+def test_compiled_rules_match_reference(bank, answer_sets):
+    for answers in answer_sets:
+        assert bank.rules.diagnose(answers) == reference_diagnose(bank.rules.rules, answers)
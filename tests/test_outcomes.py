@@ -0,0 +1,15 @@
+from outcomes import OutcomeTable, build, write_table
+from reference import reference_diagnose
+
+
+def test_outcome_table_matches_reference(bank, answer_sets, tmp_path):
+    # A small entry limit leaves some rules untabulated, exercising the fallback too.
+    for name, max_entries in (("full.table", 1 << 22), ("small.table", 64)):
+        path = tmp_path / name
+        write_table(str(path), *build(bank, max_entries))
+        table = OutcomeTable(str(path), bank)
+        try:
+            for answers in answer_sets:
+                assert table.diagnose(answers) == reference_diagnose(bank.rules.rules, answers)
+        finally:
+            table.close()
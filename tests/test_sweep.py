@@ -0,0 +1,59 @@
+import math
+import random
+
+import sweep
+from conftest import random_severities
+from engine import SEVERITY_MILD, SEVERITY_MODERATE, SEVERITY_SEVERE
+
+SEVERITY_PARAMS = {SEVERITY_MILD: "mild", SEVERITY_MODERATE: "moderate", SEVERITY_SEVERE: "severe"}
+
+
+def reference_positive(rules, answers, p):
+    """{dsm_code: reported?} recomputed from scratch with the constants in ``p``."""
+    reported = {}
+    for rule in rules:
+        present_count = 0
+        total_weight = 0.0
+        for sym in rule["symptoms"]:
+            candidates = sym["any_of"] if isinstance(sym, dict) else [sym]
+            for candidate in candidates:
+                ans = answers.get(candidate)
+                if not ans or ans["value"] != "yes" or ans["severity"] not in SEVERITY_PARAMS:
+                    continue
+                n_codes = len(ans["dsm_codes"])
+                weight = max(p["min_weight"], p["base_weight"] - p["reduction"] * (n_codes - 1))
+                weight = round(weight * p[SEVERITY_PARAMS[ans["severity"]]], 2)
+                if weight > 0:
+                    present_count += 1
+                    total_weight += weight
+                    break
+        threshold = max(1, math.ceil(len(rule["symptoms"]) * p["symptom_threshold"]))
+        reported[rule["dsm_code"]] = (present_count >= threshold
+                                      and total_weight / present_count * 100 >= p["certainty_threshold"])
+    return reported
+
+
+def test_sweep_matches_reference(bank):
+    rnd = random.Random(3)
+    corpus = sweep.Corpus(bank)
+    answer_sets = []
+    while corpus.size < 2000:
+        severities = random_severities(bank, rnd, answered=0.6)
+        size = corpus.size
+        corpus.add(severities)
+        if corpus.size > size:
+            answer_sets.append(bank.replay_answers(severities))
+
+    grid = sweep.parse_grid(None, ["symptom_threshold=0.5,0.7", "certainty_threshold=30,45",
+                                   "mild=0,0.5", "severe=0.8,1", "reduction=0.2,0.25"])
+    results = list(sweep.run_sweep(corpus, grid))
+    assert len(results) == 32
+
+    baseline = [reference_positive(bank.rules.rules, a, sweep.DEFAULTS) for a in answer_sets]
+    for answers, reported in zip(answer_sets, baseline):
+        assert {d["dsm_code"] for d in bank.rules.diagnose(answers)} == {c for c, r in reported.items() if r}
+    for result in results:
+        expected = [reference_positive(bank.rules.rules, a, result) for a in answer_sets]
+        for code, disorder in result["disorders"].items():
+            assert disorder["positive"] == sum(e[code] for e in expected), (code, result)
+            assert disorder["flips"] == sum(e[code] != b[code] for e, b in zip(expected, baseline)), (code, result)
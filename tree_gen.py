@@ -1,13 +1,20 @@
+import argparse
+import hashlib
 import json
-import graphviz
 import os
-import math
+import subprocess
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from engine import CERTAINTY_THRESHOLD, SEVERITY_ADJUSTMENT, rule_threshold
 
 def load_questions():
     with open("questions.json", "r") as f:
         return json.load(f)
 
+def codes_by_symptom(questions):
+    """DSM codes per symptom, so dependency checks are a lookup instead of a scan"""
+    return {q["symptom"]: set(q.get("dsm_codes", [])) for q in questions}
+
 def define_disorders():
     return {
         "296.2x": "Major Depressive Disorder",
@@ -19,20 +26,29 @@ def define_disorders():
         "309.81": "PTSD"
     }
 
-# Define severity adjustments (same as in app.py)
+# Severity adjustments shared with the scoring engine
 def define_severity_adjustments():
-    return {
-        "severe": 1.0,
-        "moderate": 0.75,
-        "mild": 0.5,
-        "none": 0.0
-    }
+    return dict(SEVERITY_ADJUSTMENT, none=0.0)
 
-def create_decision_tree():
-    questions = load_questions()
+def severity_percent(severity_adjustments, level):
+    return f"{severity_adjustments[level] * 100:.0f}%"
+
+def severity_scaling_text(severity_adjustments):
+    """Severe/Moderate/Mild percentages, one per line, for edge and legend labels"""
+    return "\n".join(
+        f"{level.title()}: {severity_percent(severity_adjustments, level)}"
+        for level in ("severe", "moderate", "mild")
+    )
+
+def create_decision_tree(questions=None):
+    if questions is None:
+        questions = load_questions()
     disorders = define_disorders()
     severity_adjustments = define_severity_adjustments()
     
+    # Imported on use so code that only needs the disorder metadata never loads graphviz
+    import graphviz
+
     # Create a new Graphviz digraph
     dot = graphviz.Digraph(comment='DSM-5-TR Decision Tree')
     dot.attr(rankdir='LR')  # Left to right layout
@@ -45,7 +61,7 @@ def create_decision_tree():
             symptoms_per_disorder[dsm_code] += 1
             
     # Calculate threshold (70% of symptoms required)
-    threshold_per_disorder = {code: math.ceil(count * 0.7) for code, count in symptoms_per_disorder.items()}
+    threshold_per_disorder = {code: rule_threshold(count) for code, count in symptoms_per_disorder.items()}
     
     # Track which questions have dependencies and which are entry points
     has_dependency = set()
@@ -60,7 +76,7 @@ def create_decision_tree():
         threshold = threshold_per_disorder.get(code, 0)
         total = symptoms_per_disorder.get(code, 0)
         dot.node(f"disorder_{code}", 
-                f"{name}\n({code})\nRequired: {threshold}/{total} symptoms\nMinimum certainty: 40%", 
+                f"{name}\n({code})\nRequired: {threshold}/{total} symptoms\nMinimum certainty: {CERTAINTY_THRESHOLD}%", 
                 shape='box', style='filled', fillcolor='lightsalmon')
     
     # Add nodes for questions (using symptom names instead of full questions)
@@ -94,7 +110,7 @@ def create_decision_tree():
                 dot.edge(node_id, f"disorder_{dsm_code}", 
                         style="dashed", 
                         color="purple", 
-                        label="Severity scaling:\nSevere: 100%\nModerate: 75%\nMild: 50%")
+                        label="Severity scaling:\n" + severity_scaling_text(severity_adjustments))
     
     # Find entry point questions (those without dependencies)
     entry_points = []
@@ -111,9 +127,9 @@ def create_decision_tree():
     # Add a global legend explaining severity impact
     with dot.subgraph(name="cluster_legend") as legend:
         legend.attr(label="Severity Impact Legend", style="filled", fillcolor="white")
-        legend.node("legend_severe", "Severe: 100% impact", shape="box", style="filled", fillcolor="#FFCCCC")
-        legend.node("legend_moderate", "Moderate: 75% impact", shape="box", style="filled", fillcolor="#FFEEBB")
-        legend.node("legend_mild", "Mild: 50% impact", shape="box", style="filled", fillcolor="#FFFFCC")
+        legend.node("legend_severe", f"Severe: {severity_percent(severity_adjustments, 'severe')} impact", shape="box", style="filled", fillcolor="#FFCCCC")
+        legend.node("legend_moderate", f"Moderate: {severity_percent(severity_adjustments, 'moderate')} impact", shape="box", style="filled", fillcolor="#FFEEBB")
+        legend.node("legend_mild", f"Mild: {severity_percent(severity_adjustments, 'mild')} impact", shape="box", style="filled", fillcolor="#FFFFCC")
         
         # Connect legend nodes invisibly to create a vertical layout
         legend.edge("legend_severe", "legend_moderate", style="invis")
@@ -121,9 +137,12 @@ def create_decision_tree():
     
     return dot
 
-def create_disorder_specific_tree(target_disorder):
+def create_disorder_specific_tree(target_disorder, questions=None, symptom_codes=None):
     """Create a decision tree focused on a single disorder"""
-    questions = load_questions()
+    if questions is None:
+        questions = load_questions()
+    if symptom_codes is None:
+        symptom_codes = codes_by_symptom(questions)
     disorders = define_disorders()
     severity_adjustments = define_severity_adjustments()
     
@@ -133,17 +152,18 @@ def create_disorder_specific_tree(target_disorder):
     disorder_name = disorders[target_disorder]
     
     # Create a new Graphviz digraph
+    import graphviz
     dot = graphviz.Digraph(comment=f'{disorder_name} Decision Tree')
     dot.attr(rankdir='TB')  # Top to bottom layout
     dot.attr('node', shape='box', style='rounded,filled', fillcolor='lightblue')
     
     # Count symptoms for threshold calculation
     symptom_count = sum(1 for q in questions if target_disorder in q.get("dsm_codes", []))
-    threshold = math.ceil(symptom_count * 0.7)
+    threshold = rule_threshold(symptom_count)
     
     # Add disorder node
     dot.node(f"disorder", 
-            f"{disorder_name}\n({target_disorder})\nRequired: {threshold}/{symptom_count} symptoms\nMinimum certainty: 40%", 
+            f"{disorder_name}\n({target_disorder})\nRequired: {threshold}/{symptom_count} symptoms\nMinimum certainty: {CERTAINTY_THRESHOLD}%", 
             shape='box', style='filled', fillcolor='lightsalmon')
     
     # Track dependencies
@@ -169,18 +189,18 @@ def create_disorder_specific_tree(target_disorder):
             
             # Create a gradient label for severity
             dot.edge(node_id, "disorder", 
-                   label="Severity Impact:\nSevere: 100%\nModerate: 75%\nMild: 50%",
+                   label="Severity Impact:\n" + severity_scaling_text(severity_adjustments),
                    color="purple", style="dashed")
         
         # Add dependency edges
         if "dependency" in q:
             dep = q["dependency"]
             # Only add edge if dependency is also relevant to this disorder
-            if any(target_disorder in dq.get("dsm_codes", []) for dq in questions if dq["symptom"] == dep):
+            if target_disorder in symptom_codes.get(dep, ()):
                 dot.edge(f"q_{dep}", node_id, label="Yes")
         elif "dependencies" in q:
             for dep in q["dependencies"]:
-                if any(target_disorder in dq.get("dsm_codes", []) for dq in questions if dq["symptom"] == dep):
+                if target_disorder in symptom_codes.get(dep, ()):
                     dot.edge(f"q_{dep}", node_id, label="Yes")
     
     # Add start node connecting to entry points
@@ -194,9 +214,12 @@ def create_disorder_specific_tree(target_disorder):
     
     return dot
 
-def create_simplified_tree():
+def create_simplified_tree(questions=None, symptom_codes=None):
     """Create a simplified version of the decision tree with fewer connections"""
-    questions = load_questions()
+    if questions is None:
+        questions = load_questions()
+    if symptom_codes is None:
+        symptom_codes = codes_by_symptom(questions)
     disorders = define_disorders()
     severity_adjustments = define_severity_adjustments()
     
@@ -207,8 +230,9 @@ def create_simplified_tree():
             symptoms_per_disorder[dsm_code] += 1
             
     # Calculate threshold (70% of symptoms required)
-    threshold_per_disorder = {code: math.ceil(count * 0.7) for code, count in symptoms_per_disorder.items()}
+    threshold_per_disorder = {code: rule_threshold(count) for code, count in symptoms_per_disorder.items()}
     
+    import graphviz
     dot = graphviz.Digraph(comment='Simplified DSM-5-TR Decision Tree')
     dot.attr(rankdir='TB')  # Top to bottom layout
     dot.attr('node', shape='box', style='rounded,filled', fillcolor='lightblue')
@@ -225,7 +249,7 @@ def create_simplified_tree():
             
             # Add severity legend to each disorder cluster
             c.node(f"severity_legend_{code}", 
-                   "Severity Impact:\nSevere: 100%\nModerate: 75%\nMild: 50%",
+                   "Severity Impact:\n" + severity_scaling_text(severity_adjustments),
                    shape="note", style="filled", fillcolor="lightcyan")
             
             # Add relevant questions
@@ -243,56 +267,99 @@ def create_simplified_tree():
                     if "dependency" in q:
                         dep = q["dependency"]
                         dep_node = f"{code}_{dep}"
-                        if any(code in dq.get("dsm_codes", []) for dq in questions if dq["symptom"] == dep):
+                        if code in symptom_codes.get(dep, ()):
                             c.edge(dep_node, node_id, label="Yes")
     
     return dot
 
-def main():
-    dot = create_decision_tree()
-    
-    output_dir = "renders"
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "decision_tree")
-    
+def build_graphs(questions):
+    """(output name, DOT source) for every diagram, built from one loaded bank"""
+    symptom_codes = codes_by_symptom(questions)
+    graphs = [
+        ("decision_tree", create_decision_tree(questions)),
+        ("decision_tree_simple", create_simplified_tree(questions, symptom_codes)),
+    ]
+    for dsm_code in define_disorders():
+        graphs.append((f"decision_tree_{dsm_code}",
+                       create_disorder_specific_tree(dsm_code, questions, symptom_codes)))
+    return [(name, dot.source) for name, dot in graphs]
+
+def source_hash(source, formats):
+    return hashlib.sha256("\0".join([source, *formats]).encode()).hexdigest()
+
+def load_manifest(path):
     try:
-        # Try to render using different formats
-        dot.render(output_path, format='png', cleanup=True)
-        print(f"Decision tree generated at {output_path}.png")
-        
-        # Also generate SVG for better web viewing
-        dot.render(output_path, format='svg', cleanup=True)
-        print(f"Decision tree generated at {output_path}.svg")
-        
-        # Generate the simplified tree
-        simplified_dot = create_simplified_tree()
-        simplified_output = os.path.join(output_dir, "decision_tree_simple")
-        simplified_dot.render(simplified_output, format='png', cleanup=True)
-        simplified_dot.render(simplified_output, format='svg', cleanup=True)
-        print(f"Simplified tree generated at {simplified_output}.png/svg")
-        
-        # Generate individual disorder-specific trees
-        disorders = define_disorders()
-        for dsm_code in disorders:
-            disorder_dot = create_disorder_specific_tree(dsm_code)
-            disorder_output = os.path.join(output_dir, f"decision_tree_{dsm_code}")
-            disorder_dot.render(disorder_output, format='png', cleanup=True)
-            disorder_dot.render(disorder_output, format='svg', cleanup=True)
-            print(f"Disorder tree for {dsm_code} generated at {disorder_output}.png/svg")
-    
-    except Exception as e:
-        print(f"Error rendering decision tree: {e}")
-        print("Attempting to create disorder-specific visualizations...")
-        disorders = define_disorders()
-        for dsm_code in disorders:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def render_graph(source, output_path, formats):
+    """Lay the graph out once and write every format from the same dot run"""
+    import graphviz
+    command = [graphviz.DOT_BINARY]
+    for fmt in formats:
+        command += [f"-T{fmt}", f"-o{output_path}.{fmt}"]
+    subprocess.run(command, input=source.encode(), check=True, capture_output=True)
+
+def render_all(graphs, output_dir, formats, workers=None, force=False):
+    """Render graphs whose DOT source changed since the last run; returns {name: status}"""
+    import graphviz
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, ".dot_hashes.json")
+    manifest = {} if force else load_manifest(manifest_path)
+    status = {}
+    pending = {}
+    for name, source in graphs:
+        digest = source_hash(source, formats)
+        output_path = os.path.join(output_dir, name)
+        outputs_exist = all(os.path.exists(f"{output_path}.{fmt}") for fmt in formats)
+        if manifest.get(name) == digest and outputs_exist:
+            status[name] = "unchanged"
+        else:
+            pending[name] = (source, output_path, digest)
+
+    # Each render is a separate dot process, so threads are enough to keep every CPU busy.
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            name: pool.submit(render_graph, source, output_path, formats)
+            for name, (source, output_path, _) in pending.items()
+        }
+        for name, future in futures.items():
             try:
-                disorder_dot = create_disorder_specific_tree(dsm_code)
-                disorder_output = os.path.join(output_dir, f"decision_tree_{dsm_code}")
-                disorder_dot.render(disorder_output, format='png', cleanup=True)
-                disorder_dot.render(disorder_output, format='svg', cleanup=True)
-                print(f"Disorder tree for {dsm_code} generated at {disorder_output}.png/svg")
-            except Exception as inner_e:
-                print(f"Error generating visualization for {dsm_code}: {inner_e}")
+                future.result()
+            except FileNotFoundError:
+                status[name] = f"error: Graphviz executable '{graphviz.DOT_BINARY}' not found"
+                manifest.pop(name, None)
+            except (OSError, subprocess.CalledProcessError) as e:
+                stderr = getattr(e, "stderr", None)
+                status[name] = f"error: {stderr.decode().strip() if stderr else e}"
+                manifest.pop(name, None)
+            else:
+                status[name] = "rendered"
+                manifest[name] = pending[name][2]
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the decision tree diagrams.")
+    parser.add_argument("-o", "--output-dir", default="renders")
+    parser.add_argument("--formats", default="png,svg", help="Comma-separated Graphviz output formats")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Parallel dot processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="Re-render graphs even if their DOT source is unchanged")
+    args = parser.parse_args(argv)
+
+    formats = [fmt for fmt in args.formats.split(",") if fmt]
+    graphs = build_graphs(load_questions())
+    status = render_all(graphs, args.output_dir, formats, args.workers, args.force)
+    outputs = "/".join(formats)
+    for name, _ in graphs:
+        print(f"{os.path.join(args.output_dir, name)}.{outputs}: {status[name]}")
+    if any(s.startswith("error") for s in status.values()):
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()